@@ -0,0 +1,35 @@
+## Band power calculation from PSD estimates
+
+import numpy
+
+# BandPowerTable works out, for a fixed set of frequencies, which slice of the spectrum every band covers.
+# Band limits are inclusive on both ends. Since the slices are precomputed, every band's power can then be read off
+# a single cumulative sum over the PSD, so the cost of an update barely depends on how many bands we define.
+# The table has to be rebuilt whenever the frequencies change, i.e. when fs or the segment length change.
+class BandPowerTable():
+    def __init__(self, bands, freqs):
+        self.names = list(bands.keys())
+        self.freqs = freqs
+        limits = numpy.array(list(bands.values()), dtype='float64').reshape(-1, 2)
+        self._lower_idx = numpy.searchsorted(freqs, limits[:, 0], side='left')
+        self._upper_idx = numpy.searchsorted(freqs, limits[:, 1], side='right')
+        # Bands that fall entirely between two frequency bins simply come out as empty slices
+        self._upper_idx = numpy.maximum(self._upper_idx, self._lower_idx)
+        self._cumsum = None
+
+    # Absolute power of every band for each row of pxx, with shape (..., bands), along with the total power of each row
+    def bandPowers(self, pxx):
+        shape = pxx.shape[:-1] + (pxx.shape[-1] + 1,)
+        if self._cumsum is None or self._cumsum.shape != shape:
+            self._cumsum = numpy.zeros(shape)
+        numpy.cumsum(pxx, axis=-1, out=self._cumsum[..., 1:])
+        band_sums = self._cumsum[..., self._upper_idx] - self._cumsum[..., self._lower_idx]
+        return band_sums, self._cumsum[..., -1]
+
+    # Power of every band relative to the total power, with shape (..., bands)
+    def relativePowers(self, pxx):
+        band_sums, total = self.bandPowers(pxx)
+        total = total[..., numpy.newaxis]
+        divs = numpy.zeros_like(band_sums)
+        numpy.divide(band_sums, total, out=divs, where=total != 0)
+        return divs
@@ -0,0 +1,53 @@
+## Batching of decoded blocks before they cross over to other threads
+
+import numpy
+from time import perf_counter
+
+# Every emit towards another thread is a queued Qt event, and small packets can easily mean dozens of those per second
+# per consumer. BlockCoalescer gathers decoded blocks into a preallocated buffer and only passes them on once
+# either the oldest pending sample has waited max_latency seconds, or max_samples samples have accumulated.
+# Each flushed block is handed to flush_callback along with the index of its first sample, counted from the start
+# of the capture, so consumers can work out the timing on their own. The block is a view into our buffer,
+# so the callback has to be done with it (e.g. by writing it into a SampleStore) before returning.
+class BlockCoalescer():
+    def __init__(self, total_channels, max_latency, max_samples, flush_callback, dtype='float64'):
+        self.max_latency = max_latency
+        self.max_samples = max_samples
+        self.flush_callback = flush_callback
+        self._buffer = numpy.empty((total_channels, max_samples), dtype=dtype)
+        self._pending = 0
+        self._first_time = 0
+        self.sample_index = 0
+
+    # Seconds left before the pending data must be flushed, or None if there is nothing pending
+    def timeRemaining(self):
+        if self._pending == 0:
+            return None
+        return max(0, self._first_time + self.max_latency - perf_counter())
+
+    def add(self, block):
+        n = block.shape[1]
+        if self._pending + n > self.max_samples:
+            self.flush()
+        # Blocks that don't fit at all are passed on as they are
+        if n > self.max_samples:
+            self._emit(block, n)
+            return
+        if self._pending == 0:
+            self._first_time = perf_counter()
+        self._buffer[:, self._pending:self._pending + n] = block
+        self._pending += n
+        if self._pending >= self.max_samples or self.timeRemaining() == 0:
+            self.flush()
+
+    def flush(self):
+        if self._pending == 0:
+            return
+        block = self._buffer[:, :self._pending]
+        self._pending = 0
+        self._emit(block, block.shape[1])
+
+    def _emit(self, block, n):
+        start = self.sample_index
+        self.sample_index += n
+        self.flush_callback(block, start)
@@ -1,18 +1,23 @@
 from PyQt6 import QtCore
 
-import numpy
-import global_vars
 import socket
-from time import sleep
+from time import sleep, perf_counter
+import stats
+from packet_framer import PacketFramer
+from sample_decoder import DECODERS, PaddedDecoder
+from block_coalescer import BlockCoalescer
+from filters import Decimator
 
 ## Class definition for thread that receives data
 # This was decoupled from the main application as it needed some custom signals for proper termination
 class DataWorker(QtCore.QObject):
     finished = QtCore.pyqtSignal()
     finishedCapture = QtCore.pyqtSignal()
-    welchBufferChanged = QtCore.pyqtSignal(numpy.ndarray)
     triggerFFT = QtCore.pyqtSignal()
-    newDataReceived = QtCore.pyqtSignal(numpy.ndarray, numpy.ndarray)
+    # Notifies consumers that samples [start, start + count) are available in the sample store
+    newDataReceived = QtCore.pyqtSignal('qint64', 'qint64')
+    # Same as above, but for the decimated stream and its store
+    decimatedDataReceived = QtCore.pyqtSignal('qint64', 'qint64')
 
     def __init__(self, settings, electrodes_model, freq_bands_model, plots):
         super().__init__()
@@ -22,6 +27,17 @@ class DataWorker(QtCore.QObject):
         self.freq_bands_model = freq_bands_model
         self.plots = plots
 
+    # Sets the stores that decoded samples get written to, shared with every consumer.
+    # The decimated store receives the stream after decimation, and may be the same store if we aren't decimating.
+    # When decimating, the full rate store can be None, in which case the full rate stream isn't kept at all.
+    def setSampleStore(self, sample_store, decimated_store=None):
+        self.sample_store = sample_store
+        self.decimated_store = decimated_store if decimated_store is not None else sample_store
+
+    # Sets the filters applied to every decoded block, before anything is stored
+    def setFilterBank(self, filter_bank):
+        self.filter_bank = filter_bank
+
     def setCapturing(self, status):
         self.is_capturing = status
 
@@ -58,11 +74,34 @@ class DataWorker(QtCore.QObject):
         self.ip = settings['socket']['ip']
         self.port = settings['socket']['port']
 
+    # Writes a coalesced block into the shared store and lets every consumer know about it
+    def emitBlock(self, samples, start_sample):
+        if self.sample_store is not None:
+            start = perf_counter()
+            self.sample_store.write(samples)
+            stats.pipeline.record("ring_write", perf_counter() - start)
+            self.newDataReceived.emit(start_sample, samples.shape[1])
+        if self.decimator.factor > 1:
+            start = perf_counter()
+            decimated = self.decimator.process(samples)
+            stats.pipeline.record("decimate", perf_counter() - start)
+            decimated_start = self.decimated_store.head
+            start = perf_counter()
+            self.decimated_store.write(decimated)
+            stats.pipeline.record("ring_write", perf_counter() - start)
+            # The plot tells our probe when it gets to this notification, so we know how long it waited in the queue
+            stats.pipeline.emit_queue.sent()
+            self.decimatedDataReceived.emit(decimated_start, decimated.shape[1])
+        else:
+            stats.pipeline.emit_queue.sent()
+            self.decimatedDataReceived.emit(start_sample, samples.shape[1])
+        if self.welch_enabled:
+            # Let the FFT worker know there's new data, it decides on its own when to actually recalculate
+            self.triggerFFT.emit()
+
     def readData(self):
         global cuda_enabled
         self.initializeData(self.settings, self.freq_bands_model)
-        x = 0
-        packet_failed = 0
         active_channels = []
         active_reference = -1
 
@@ -78,85 +117,68 @@ class DataWorker(QtCore.QObject):
             return
 
         # Forcing this to true for now, might add a hard disable later
-        welch_enabled = True
-
-        # We're seeking a 45 Hz update rate for the plots right now, so we calculate
-        # how often we need to update in terms of samples received
-        update_rate = int(numpy.ceil(self.fs / 20 / self.samples))
-        print("Update rate in packet count (aiming for 20 Hz):", update_rate)
+        self.welch_enabled = True
 
-        attempt_counter = 0
-        sample_counter = 0
         self.is_capturing = True
+        framer = PacketFramer(buffer_size)
+        # Every stage keeps the samples in the same precision, which has to match that of the sample stores
+        dtype = self.settings['pipeline']['precision']
+        decoder_class = DECODERS.get(self.settings['pipeline']['decoder'], PaddedDecoder)
+        self.decoder = decoder_class(total_channels, self.samples, self.gain, dtype=dtype, max_packets=framer.slots)
+        self.decimator = Decimator(self.settings['filter']['decimating_factor'], self.settings['filter']['lowpass_taps'], total_channels,
+                                   dtype=dtype)
+        # Gather decoded blocks so that we only cross over to the other threads every once in a while
+        max_latency = self.settings['pipeline']['max_latency'] / 1000
+        max_block = max(self.settings['pipeline']['max_block'], self.samples)
+        self.coalescer = BlockCoalescer(total_channels, max_latency, max_block, self.emitBlock, dtype=dtype)
 
         # Main data reception loop
         while True:
-            recv_data = self.sock.recv(buffer_size*2)
-            if not recv_data:
-                attempt_counter += 1
-                print("Empty packet, attempting to read again")
-                sleep(0.2)
-                if attempt_counter > 3:
-                    print("Failed to receive data, closing connection")
-                    self.sock.close()
-                    self.finishedCapture.emit()
-                    return
-                pass
-            # if(len(recv_data) > buffer_size):
-                # print("recv_data length:", len(recv_data), "buffer size", buffer_size)
-
-            # Extract all channel samples from the packet
-            # We use a try statement as occasionally packet loss messes up the data
-            packets = len(recv_data) // buffer_size
-            for i in range(packets):
-                data = recv_data[i*buffer_size:(i+1)*buffer_size]
-                try:
-                    padded_array = numpy.zeros((total_channels, self.samples, 4), dtype='uint8')
-                    # Each data packet comes with multiple 3-byte samples at a time, interleaved such that
-                    # the first sample of each channel is sent, then the second sample, and so on.
-                    # First we reshape the matrix such that each row is one 24-bit integer
-                    reshaped_data = numpy.frombuffer(buffer=data, dtype='<b').reshape(-1, 3)
-
-                    # De-interleave by transposing (Fortran order) and then reshaping into (channels * samples * bytes) shaped array
-                    deinterleave_data = reshaped_data.reshape((total_channels, self.samples, 3), order='F')
-
-                    # Copy bytes into new 4-byte array, change view to uint32, filter by only the channels we need and squeeze dimensions
-                    padded_array[:,:,-3:] = deinterleave_data
-                    samples = padded_array.view('int32').reshape(total_channels, self.samples)
-
-                    # We apply the pre-defined gain
-                    # TODO: Consider pulling this out of data parser completely?
-                    samples = samples*self.gain
-
-                    # Send sample to plot
-                    # Rate limited to only calculate the spectrum every once in a while, to avoid lag
-                    # Since we're working with an entire set of samples, we need the corresponding x values
-                    samples_time = numpy.linspace(x/self.fs, (x+self.samples-1)/self.fs, num=self.samples)
-                    self.newDataReceived.emit(samples, samples_time)
-
-                    if welch_enabled:
-                        # Update FFT worker's data storage
-                        self.welchBufferChanged.emit(samples)
-                        # Queue up an fft calculation
-                        if x % update_rate == 0:
-                            self.triggerFFT.emit()
-
-                    if not self.is_capturing:
-                        print("Stopping worker by request")
-                        self.sock.close()
-                        self.finishedCapture.emit()
-                        return
-
-                    x += self.samples
-                    sample_counter = (sample_counter + self.samples)
-                    if packet_failed > 0:
-                        packet_failed -= 1
-                    
-                except IndexError:
-                    packet_failed += 1
-                    print("Packet reading failed! Failed attempts:", packet_failed)
-                    if packet_failed > global_vars.MAX_ERRORS:
-                        print("Failed to read packets too many times, dropping connection")
-                        self.sock.close()
-                        self.finishedCapture.emit()
-                        return
+            # Only wait on the socket for as long as our pending data can still be held back
+            timeout = self.coalescer.timeRemaining()
+            if timeout == 0:
+                self.coalescer.flush()
+                timeout = None
+            self.sock.settimeout(timeout)
+            start = perf_counter()
+            received = framer.bytes_received
+            try:
+                frames = framer.readFrames(self.sock)
+            except TimeoutError:
+                self.coalescer.flush()
+                continue
+            stats.pipeline.record("recv", perf_counter() - start)
+
+            # The other end closed the connection, and everything it sent has been read by now,
+            # so we hand out whatever we were still holding back and finish
+            if frames is None:
+                stats.pipeline.count("empty_reads")
+                print("Connection closed, stopping worker")
+                self.coalescer.flush()
+                self.sock.close()
+                self.finishedCapture.emit()
+                return
+
+            # Decode every whole packet we received in one go.
+            # The framer holds on to any partial packet, so the decoder only ever sees complete packets.
+            stats.pipeline.count("bytes", framer.bytes_received - received)
+            # Reads that stopped partway through a packet. They're perfectly normal over TCP, and only tell us
+            # how finely the stream arrives, not that anything went wrong.
+            if framer.pending():
+                stats.pipeline.count("short_reads")
+            if len(frames) > 0:
+                stats.pipeline.count("packets", len(frames) // buffer_size)
+                start = perf_counter()
+                samples = self.decoder.decode(frames)
+                decoded = perf_counter()
+                filtered = self.filter_bank.process(samples)
+                stats.pipeline.record("decode", decoded - start)
+                stats.pipeline.record("filter", perf_counter() - decoded)
+                self.coalescer.add(filtered)
+
+            if not self.is_capturing:
+                print("Stopping worker by request")
+                self.coalescer.flush()
+                self.sock.close()
+                self.finishedCapture.emit()
+                return
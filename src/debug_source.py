@@ -1,18 +1,28 @@
 import socket
-import numpy
-from time import sleep, perf_counter
+import threading
+from time import perf_counter
 from PyQt6 import QtCore
-import pyedflib
+from replay_source import ReplaySource
+from pacer import Pacer
+from packet_encoder import PacketEncoder
+from signal_generator import PROFILES, SineGenerator
 
-# Worker class for opening a socket and generating a sine wave to read from
+# Worker class for opening a socket and sending either a synthetic signal or a recording to read from
 class DebugWorker(QtCore.QObject):
     finishedRead = QtCore.pyqtSignal()
     finished = QtCore.pyqtSignal()
+    # Length of the file being replayed, and how far into it we are, both in seconds
+    fileOpened = QtCore.pyqtSignal(float)
+    positionChanged = QtCore.pyqtSignal(float)
 
     def __init__(self, settings, electrodes_model):
         super().__init__()
         self.settings = settings
         self.electrodes_model = electrodes_model
+        self.source = None
+        self.source_lock = threading.Lock()
+        # Where the next replay starts, in seconds, if we're asked to seek before it does
+        self.start_time = 0.0
 
     def openSocket(self, port):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -24,6 +34,30 @@ class DebugWorker(QtCore.QObject):
     def terminate(self):
         self.terminated = True
 
+    # Moves the replay to the given time. This is called straight from the GUI thread, as our own thread is busy
+    # sending and never gets around to handling events, so it only ever tells the replay source where to go.
+    def seek(self, seconds):
+        with self.source_lock:
+            if self.source is not None:
+                self.source.seek(seconds)
+            else:
+                self.start_time = seconds
+
+    def closeSource(self):
+        with self.source_lock:
+            self.source.close()
+            self.source = None
+
+    # Sends a whole packet, as a partial one would throw the client's framing off. Returns False if the connection broke.
+    def sendPacket(self, client, data):
+        data = memoryview(data)
+        while len(data):
+            sent = client.send(data)
+            if sent == 0:
+                return False
+            data = data[sent:]
+        return True
+
     def initializeData(self, settings):
         self.port = settings['socket']['port']
         self.samples = settings['biosemi']['samples']
@@ -35,23 +69,14 @@ class DebugWorker(QtCore.QObject):
         self.terminated = False
         (client, port) = self.sock.accept()
         total_channels = self.electrodes_model.rowCount()
-        t = 0
+        generator_class = PROFILES.get(self.settings['debug']['profile'], SineGenerator)
+        generator = generator_class(total_channels, self.fs)
+        encoder = PacketEncoder(total_channels, self.samples)
+        pacer = Pacer(self.fs, self.settings['debug']['speed'])
         while True:
-            data = bytearray()
-            lspace = numpy.linspace(t, t+(self.samples/self.fs), self.samples)
-            noise_power = 0 * self.fs/2
-            for j, i in enumerate(lspace):
-                for _ in range(total_channels):
-                    noise = numpy.random.normal(scale=numpy.sqrt(noise_power), size=lspace.shape)
-                    if t < 10: val_orig = int(numpy.sin(2 * numpy.pi * 10 * i)*1000 + noise[j]) 
-                    else: val_orig = int(numpy.sin(2 * numpy.pi * 10 * i)*10 + noise[j]) 
-                    val = (val_orig).to_bytes(3, byteorder='little', signed=True)
-                    if(len(val) > 3):
-                        val = val[-3:]
-                    data.extend(val)
-            sent = client.send(data)
+            data = encoder.encode(generator.generate(self.samples))
             # If we sent no data, then the connection has been broken
-            if sent == 0:
+            if not self.sendPacket(client, data):
                 print("No data sent, terminating!")
                 self.sock.close()
                 self.finishedRead.emit()
@@ -60,51 +85,59 @@ class DebugWorker(QtCore.QObject):
                 print("Terminating debug thread!")
                 self.finishedRead.emit()
                 return
-
-            t += self.samples/self.fs
-            t = t % 20
-            sleep(self.samples/self.fs)
+            pacer.setSpeed(self.settings['debug']['speed'])
+            pacer.wait(self.samples)
 
     def generateSignalFromFile(self):
         self.initializeData(self.settings)
         self.openSocket(self.port)
         self.terminated = False
         total_channels = self.electrodes_model.rowCount()
-        f = pyedflib.EdfReader(self.settings['file']['current_file'])
-        n = f.signals_in_file
-        signal_labels = f.getSignalLabels()
-        print(signal_labels)
-        sigbufs = numpy.zeros((total_channels, f.getNSamples()[0]), dtype=numpy.int32)
-        for i in numpy.arange(total_channels):
-            sigbufs[i, :] = f.readSignal(i)
-        file_length = sigbufs.shape[1]
-        sigbufs_bytes = bytearray()
-        for samples in sigbufs.T:
-            for sample in samples:
-                val = int(sample).to_bytes(3, byteorder='little', signed=True)
-                if(len(val) > 3):
-                    val = val[-3:]
-                sigbufs_bytes.extend(val)
-        print("Finished processing file, waiting for client")
+        source = ReplaySource(self.settings['file']['current_file'], total_channels, self.samples)
+        print(source.reader.getSignalLabels())
+        self.fileOpened.emit(source.index.duration)
+        packet_size = self.samples*total_channels*3
+        print("Opened file, waiting for client")
         (client, port) = self.sock.accept()
         print("Connected to client, sending data")
-        for i in range(0, file_length):
-            sent = client.send(sigbufs_bytes[(i*self.samples*total_channels*3):((i+1)*self.samples*total_channels*3)])
-            if sent == 0:
-                print("No data sent, terminating!")
-                self.sock.close()
-                f.close()
-                self.finishedRead.emit()
-                return
-            if self.terminated:
-                print("Terminating debug thread!")
-                self.sock.close()
-                f.close()
-                self.finishedRead.emit()
-                return
-            sleep(self.samples/self.fs)
+        with self.source_lock:
+            self.source = source
+            source.seek(self.start_time)
+            self.start_time = 0.0
+        pacer = Pacer(source.fs, self.settings['debug']['speed'])
+        last_report = 0
+        while True:
+            chunk = source.read()
+            if chunk is None:
+                break
+            (seeks, position, data) = chunk
+            for i in range(0, len(data), packet_size):
+                # Whatever is left of the chunk is stale once we've been asked to seek
+                if source.seeks != seeks:
+                    break
+                if not self.sendPacket(client, data[i:i + packet_size]):
+                    print("No data sent, terminating!")
+                    self.sock.close()
+                    self.closeSource()
+                    self.finishedRead.emit()
+                    return
+                if self.terminated:
+                    print("Terminating debug thread!")
+                    self.sock.close()
+                    self.closeSource()
+                    self.finishedRead.emit()
+                    return
+                # Report our position a few times a second at most, however fast we're replaying
+                if perf_counter() - last_report > 0.1:
+                    self.positionChanged.emit((position + (i // packet_size)*self.samples) / source.fs)
+                    last_report = perf_counter()
+                pacer.setSpeed(self.settings['debug']['speed'])
+                pacer.wait(self.samples)
+        # Closing our end lets the client read everything we sent before it sees the connection close,
+        # so it stops the capture on its own once it's done
         print("No more file to read, terminating")
+        client.close()
         self.sock.close()
-        f.close()
+        self.closeSource()
         self.finishedRead.emit()
-        return
\ No newline at end of file
+        return
@@ -0,0 +1,171 @@
+## Min/max downsampling of the sample store for plotting
+
+import numpy
+
+# A screen can't show more than a couple of values per pixel column, so the plot only needs the minimum and maximum
+# of the samples falling in each column. MinMaxCache keeps those for every channel, in bins of bin_size samples.
+# Bins are aligned to the sample sequence numbers of the store rather than to the view, so scrolling never moves them:
+# only the bins touched by new samples are computed on each update, and the cache only has to be rebuilt
+# when the bin size changes (i.e. the view is zoomed in/out or resized) or the reference channel changes.
+# The cache covers at most window samples, and the values it holds are relative to the reference channel.
+class MinMaxCache():
+    def __init__(self, total_channels, window, dtype='float64'):
+        self.total_channels = total_channels
+        self.window = window
+        self.dtype = dtype
+        self.bin_size = None
+        self.ref_channel = -1
+        self._first = 0
+        self._last = 0
+        self._start = 0
+
+    def _reset(self, bin_size, ref_channel):
+        self.bin_size = bin_size
+        self.ref_channel = ref_channel
+        self.slots = self.window // bin_size + 3
+        self._min = numpy.zeros((self.total_channels, self.slots), dtype=self.dtype)
+        self._max = numpy.zeros((self.total_channels, self.slots), dtype=self.dtype)
+        # Sequence numbers of the samples holding each extreme, so they can be drawn in the right order and place
+        self._min_idx = numpy.zeros((self.total_channels, self.slots), dtype='int64')
+        self._max_idx = numpy.zeros((self.total_channels, self.slots), dtype='int64')
+        # First bin that isn't complete yet, and so has to be computed again on the next update
+        self._next_bin = None
+
+    # Brings the cache up to date with the samples [start, stop) of the store
+    def update(self, sample_store, start, stop, bin_size, ref_channel=-1):
+        bin_size = max(int(bin_size), 1)
+        if bin_size != self.bin_size or ref_channel != self.ref_channel:
+            self._reset(bin_size, ref_channel)
+        first = start // bin_size
+        last = -(-stop // bin_size)
+        new_first = first if self._next_bin is None else max(first, self._next_bin)
+        if new_first < last and start < stop:
+            self._computeBins(sample_store, new_first, last, max(start, new_first*bin_size), stop)
+        self._next_bin = stop // bin_size
+        self._first = first
+        self._last = last
+        self._start = start
+
+    # Computes the bins [first, last), of which we have the samples [start, stop)
+    def _computeBins(self, sample_store, first, last, start, stop):
+        bin_size = self.bin_size
+        data = sample_store.view(start, stop)
+        n_bins = last - first
+        offset = start - first*bin_size
+        n = stop - start
+        # Bins at either end may only be partially covered, so we pad them with their outermost samples,
+        # which leaves their extremes untouched
+        padded = numpy.empty((self.total_channels, n_bins*bin_size), dtype=self.dtype)
+        padded[:, offset:offset + n] = data
+        if self.ref_channel != -1:
+            padded[:, offset:offset + n] -= data[self.ref_channel]
+        padded[:, :offset] = padded[:, offset, numpy.newaxis]
+        padded[:, offset + n:] = padded[:, offset + n - 1, numpy.newaxis]
+        bins = padded.reshape(self.total_channels, n_bins, bin_size)
+        min_arg = numpy.argmin(bins, axis=-1)
+        max_arg = numpy.argmax(bins, axis=-1)
+        slots = numpy.arange(first, last) % self.slots
+        bin_starts = numpy.arange(first, last) * bin_size
+        self._min[:, slots] = numpy.take_along_axis(bins, min_arg[..., numpy.newaxis], axis=-1)[..., 0]
+        self._max[:, slots] = numpy.take_along_axis(bins, max_arg[..., numpy.newaxis], axis=-1)[..., 0]
+        # Extremes found in the padding belong to the outermost samples we actually have
+        self._min_idx[:, slots] = numpy.clip(bin_starts + min_arg, start, stop - 1)
+        self._max_idx[:, slots] = numpy.clip(bin_starts + max_arg, start, stop - 1)
+
+    # Returns the sequence numbers and values of the extremes of the given channels, each with shape
+    # (channels, 2*bins) and in the order they occurred. A bin only partially inside the window is left out,
+    # so that nothing older than the window is drawn.
+    def extrema(self, channels):
+        first = self._first if self._start % self.bin_size == 0 else self._first + 1
+        slots = numpy.arange(first, self._last) % self.slots
+        channels = numpy.asarray(channels, dtype='int64')[:, numpy.newaxis]
+        min_idx = self._min_idx[channels, slots]
+        max_idx = self._max_idx[channels, slots]
+        mins = self._min[channels, slots]
+        maxs = self._max[channels, slots]
+        min_first = min_idx <= max_idx
+        idx = numpy.stack((numpy.where(min_first, min_idx, max_idx), numpy.where(min_first, max_idx, min_idx)), axis=-1)
+        values = numpy.stack((numpy.where(min_first, mins, maxs), numpy.where(min_first, maxs, mins)), axis=-1)
+        return idx.reshape(len(channels), -1), values.reshape(len(channels), -1)
+
+# MinMaxPyramid keeps the history of every channel well beyond what the sample store holds, as a mipmap of min/max bins.
+# The first level holds bins of base_bin samples, and each following level merges pairs of bins of the one before it.
+# Every level is a ring of max_bins bins, so finer levels only reach back a little while and the coarsest one spans
+# at least history samples, all in bounded memory. Levels are filled in as samples arrive, one level from the next,
+# so a view of any length can be drawn from the level whose bins match its pixels, at a cost that only depends on
+# how many pixels we draw. As with MinMaxCache, the values are relative to the reference channel.
+class MinMaxPyramid():
+    def __init__(self, total_channels, history, base_bin=16, max_bins=4096, dtype='float64'):
+        self.total_channels = total_channels
+        self.max_bins = max_bins
+        self.base_bin = base_bin
+        self.levels = [base_bin]
+        while self.levels[-1]*max_bins < history:
+            self.levels.append(self.levels[-1]*2)
+        self._min = [numpy.zeros((total_channels, max_bins), dtype=dtype) for _ in self.levels]
+        self._max = [numpy.zeros((total_channels, max_bins), dtype=dtype) for _ in self.levels]
+        self.reset(0)
+
+    # Forgets all history and starts over from sample start, e.g. when the reference channel changes
+    def reset(self, start, ref_channel=-1):
+        self.ref_channel = ref_channel
+        first = -(-start // self.levels[0])
+        # First bin held and number of complete bins so far (counted from the start of the capture), for every level
+        self._first = [-(-first // 2**level) for level in range(len(self.levels))]
+        self._complete = list(self._first)
+
+    # Sequence number of the oldest sample held by a level, or by the coarsest one by default
+    def oldest(self, level=-1):
+        first = max(self._first[level], self._complete[level] - self.max_bins)
+        return first * self.levels[level]
+
+    # Adds the samples of the store up to stop, of which we only keep complete bins
+    def update(self, sample_store, stop):
+        base = self.levels[0]
+        if self._complete[0]*base < sample_store.oldest():
+            # We've fallen so far behind that the samples we need are gone, so we start over
+            self.reset(sample_store.oldest(), self.ref_channel)
+        # Never add more bins than half a ring at once, so the level above can still read them after we're done
+        while self._complete[0] < stop // base:
+            first = self._complete[0]
+            last = min(stop // base, first + self.max_bins // 2)
+            data = sample_store.view(first*base, last*base)
+            if self.ref_channel != -1:
+                data = data - data[self.ref_channel]
+            bins = data.reshape(self.total_channels, last - first, base)
+            slots = numpy.arange(first, last) % self.max_bins
+            self._min[0][:, slots] = numpy.min(bins, axis=-1)
+            self._max[0][:, slots] = numpy.max(bins, axis=-1)
+            self._complete[0] = last
+            for level in range(1, len(self.levels)):
+                first = self._complete[level]
+                last = self._complete[level - 1] // 2
+                if last <= first:
+                    break
+                left = numpy.arange(2*first, 2*last, 2) % self.max_bins
+                right = (left + 1) % self.max_bins
+                slots = numpy.arange(first, last) % self.max_bins
+                self._min[level][:, slots] = numpy.minimum(self._min[level - 1][:, left], self._min[level - 1][:, right])
+                self._max[level][:, slots] = numpy.maximum(self._max[level - 1][:, left], self._max[level - 1][:, right])
+                self._complete[level] = last
+
+    # Picks the finest level with bins of at most bin_size samples that still reaches back to sample start
+    def levelFor(self, bin_size, start):
+        level = max(numpy.searchsorted(self.levels, bin_size, side='right') - 1, 0)
+        while level < len(self.levels) - 1 and self.oldest(level) > start:
+            level += 1
+        return level
+
+    # Returns the positions, as sequence numbers, and values of the extremes of the given channels between samples
+    # start and stop, read from a level. The minimum and maximum of each bin are both placed at its center,
+    # so positions have shape (2*bins,) and values have shape (channels, 2*bins).
+    def extrema(self, channels, start, stop, level):
+        bin_size = self.levels[level]
+        first = max(start // bin_size, self.oldest(level) // bin_size)
+        last = min(-(-stop // bin_size), self._complete[level])
+        bins = numpy.arange(first, max(last, first))
+        slots = bins % self.max_bins
+        channels = numpy.asarray(channels, dtype='int64')[:, numpy.newaxis]
+        values = numpy.stack((self._min[level][channels, slots], self._max[level][channels, slots]), axis=-1)
+        positions = numpy.repeat(bins*bin_size + bin_size/2, 2)
+        return positions, values.reshape(len(channels), -1)
@@ -1,20 +1,26 @@
 from PyQt6 import QtCore
-from dvg_ringbuffer import RingBuffer
 import numpy
-from scipy import signal, fft
-import pyfftw
-fft.set_global_backend(pyfftw.interfaces.scipy_fft)
-pyfftw.interfaces.cache.enable()
-pyfftw.interfaces.cache.set_keepalive_time(3)
+from time import perf_counter
 
 import global_vars
+from band_power import BandPowerTable
+from fft_wisdom import saveWisdom
+from welch import IncrementalWelch
+import stats
 
 # Worker class that handles calculating FFT plot within our program
 class FFTWorker(QtCore.QObject):
     finished = QtCore.pyqtSignal()
     newDataReceived = QtCore.pyqtSignal(numpy.ndarray, numpy.ndarray)
     bandsUpdated = QtCore.pyqtSignal(list)
-    
+    # Per-channel spectra (active channels x freqs) and relative band powers (active channels x bands),
+    # only emitted when per-channel PSDs are enabled. Nothing in the UI uses them yet, they're there for
+    # views and outputs that want to look at channels separately.
+    channelPsdUpdated = QtCore.pyqtSignal(numpy.ndarray, numpy.ndarray)
+    channelBandsUpdated = QtCore.pyqtSignal(numpy.ndarray)
+    # Achieved PSD latency (seconds from the oldest pending request to the result) and refresh rate (Hz)
+    latencyUpdated = QtCore.pyqtSignal(float, float)
+
     # Initialize worker with a view of the models, to keep it synchronized
     def __init__(self, settings, electrodes_model, freq_bands_model):
         super().__init__()
@@ -22,28 +28,26 @@ class FFTWorker(QtCore.QObject):
         self.electrodes_model = electrodes_model
         self.freq_bands_model = freq_bands_model
         self.ref_channel = -1
+        self.per_channel = False
+        self._welch_dirty = False
+        self._timer = None
 
     # Notify that the worker has finished working
     def terminate(self):
         self.finished.emit()
 
-    # Update internal FFT ring buffers with new data
-    def updateBuffers(self, samples):
-        for i, channel in enumerate(samples):
-            self.welch_buffers[i].extend(channel)
+    # Set the store holding the incoming samples, which we read our Welch window from.
+    # This is the decimated store, so its rate is fs divided by our decimating factor.
+    def setSampleStore(self, sample_store):
+        self.sample_store = sample_store
 
-    # Initialize ring buffers used for FFT
-    def initializeBuffers(self, total_channels):
-        self.welch_buffers = []
-        for i in range(total_channels):
-            buf = RingBuffer(capacity=self.welch_window)
-            buf.extend(numpy.zeros(self.welch_window))
-            self.welch_buffers.append(buf)
-    
     # Initialize worker with the current configuration for FFT calculation, set before starting capture
     def initializeWorker(self):
-        self.welch_window = self.settings['fft']['welch_window']
-        self.fs = self.settings['biosemi']['fs']
+        self.initializeScheduler()
+        # Everything runs on the decimated stream, so our window shrinks along with the sample rate
+        decimating_factor = max(self.settings['filter']['decimating_factor'], 1)
+        self.welch_window = self.settings['fft']['welch_window'] // decimating_factor
+        self.fs = self.settings['biosemi']['fs'] / decimating_factor
         self.total_channels = self.electrodes_model.rowCount()
         # Determine which channels we're interested in reading from
         self.active_channels = []
@@ -52,41 +56,113 @@ class FFTWorker(QtCore.QObject):
             idx = self.electrodes_model.index(i,1)
             if self.electrodes_model.itemFromIndex(idx).data(): 
                 self.active_channels.append(i)
-        self.initializeBuffers(self.total_channels)
+        # In per-channel mode we keep a spectrum for every channel, after the one of the averaged signal
+        self.per_channel = self.settings['fft']['per_channel']
+        rows = self.total_channels + 1 if self.per_channel else 1
+        # Plan our transforms now rather than on the first PSD, and keep whatever FFTW learned for the next session
+        self.welch = IncrementalWelch(self.fs, self.welch_window//5, self.welch_window, rows, dtype=self.sample_store.dtype)
+        self.welch.warmUp()
+        saveWisdom(global_vars.WISDOM_FILE)
+        # Our frequencies are fixed from here on, so we can work out every band's slice of the spectrum ahead of time
+        self.band_table = BandPowerTable(self.settings['fft']['bands'], self.welch.freqs)
+        self._band_indices = []
+        for band in self.band_table.names:
+            idx = self.freq_bands_model.match(self.freq_bands_model.index(0,0), QtCore.Qt.ItemDataRole.DisplayRole, band)[0]
+            self._band_indices.append(idx.siblingAtColumn(1))
 
     # Set active channels, for use during capture
+    # The averaged signal we estimate the PSD of changes with them, so the cached segments are no longer valid
     def setActiveChannels(self, channels):
         self.active_channels = channels
+        self._welch_dirty = True
 
     # Set reference channel, for use during capture
     def setReferenceChannel(self, channel):
         self.ref_channel = channel
+        self._welch_dirty = True
 
-    # Slot that plots FFT when requested from a different thread.
-    # This is a fairly expensive operation, so we try not to do it very often.
-    #
-    # TODO: Currently we have two separate throttles happening for FFT, one located in 
-    # DataWorker and another located in GraphWindow for the FFT plot. This could easily be condensed
-    # into a single throttle, likely located in this particular worker.
-    # This could also lead to just moving updateBuffers into the start of plotFFT, therefore removing an emit entirely.
-    def plotFFT(self):
-        # No channels selected, so we don't plot anything
-        if len(self.active_channels) == 0:
-            return
-        
+    # Lump together all currently used channels, so we can take the average and then calculate our PSD.
+    # In per-channel mode, every channel is also kept as its own row after the average.
+    def _combineChannels(self, data):
         # Select our reference channel, if needed
         if self.ref_channel != -1:
-            ref = self.welch_buffers[self.ref_channel]
+            ref = data[self.ref_channel]
         else:
             ref = 0
+        average = numpy.average(data[self.active_channels] - ref, axis=0, keepdims=True)
+        if self.per_channel:
+            return numpy.concatenate((average, data - ref))
+        return average
+
+    # The scheduler timer has to be created from within our thread, so this runs as part of initializeWorker
+    def initializeScheduler(self):
+        if self._timer is None:
+            self._timer = QtCore.QTimer()
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self.runScheduledFFT)
+        self._timer.stop()
+        self.min_interval = 1 / self.settings['fft']['refresh_rate']
+        self.interval = self.min_interval
+        self._compute_time = 0
+        self._pending_since = None
+        self._next_allowed = 0
+        self._last_run = None
+
+    # Drops any pending request, used once the capture has stopped
+    def stopScheduler(self):
+        if self._timer is not None:
+            self._timer.stop()
+        self._pending_since = None
 
-        # Lump together all currently used channels, so we can take the average and then calculate our PSD.
-        active_buffers = []
-        for i in self.active_channels:
-            active_buffers.append(self.welch_buffers[i].__array__() - ref)
-        active_buffers = numpy.vstack(active_buffers)
-        avg_buffer = numpy.average(active_buffers, axis=0)
-        f, pxx = signal.welch(x=avg_buffer, fs=self.fs, nperseg=self.welch_window//5)
+    # Slot that requests a new PSD from a different thread.
+    # Requests only mark that newer data is available, so however many of them queue up while we're busy computing,
+    # only one calculation runs afterwards, using the latest data in the store.
+    def requestFFT(self):
+        stats.pipeline.count("fft_requests")
+        if self._pending_since is None:
+            self._pending_since = perf_counter()
+        if not self._timer.isActive():
+            delay = max(0, self._next_allowed - perf_counter())
+            self._timer.start(int(delay * 1000))
+
+    # Runs the pending request and adapts our refresh interval to how long the calculation took,
+    # so that slower machines refresh less often rather than falling behind.
+    def runScheduledFFT(self):
+        if self._pending_since is None:
+            return
+        pending_since = self._pending_since
+        self._pending_since = None
+        start = perf_counter()
+        self.plotFFT()
+        end = perf_counter()
+        stats.pipeline.record("fft", end - start)
+        stats.pipeline.count("fft_runs")
+        # Smooth out our compute time a bit so a single slow run doesn't throttle us for long
+        self._compute_time = 0.8*self._compute_time + 0.2*(end - start)
+        self.interval = max(self.min_interval, 2*self._compute_time)
+        self._next_allowed = start + self.interval
+        if self._last_run is not None:
+            self.latencyUpdated.emit(end - pending_since, 1 / (start - self._last_run))
+        self._last_run = start
+
+    # Calculates the PSD of the latest data and plots it.
+    # This is a fairly expensive operation, so it only runs through our scheduler.
+    def plotFFT(self):
+        # No channels selected, so we don't plot anything
+        if len(self.active_channels) == 0:
+            return
+        
+        # Only the segments completed since our last call are computed, the rest are reused from the cache
+        if self._welch_dirty:
+            self.welch.reset()
+            self._welch_dirty = False
+        f, psd = self.welch.update(self.sample_store, self._combineChannels)
+        # The averaged signal always drives our plot and bands, whether or not we keep the channels' spectra too
+        pxx = psd[0]
+        if self.per_channel:
+            channel_psd = psd[1:][self.active_channels]
+            self.channelPsdUpdated.emit(f, channel_psd)
+            self.channelBandsUpdated.emit(self.band_table.relativePowers(channel_psd))
         # Remove any 0 values so that our logarithm doesn't produce invalid results
         pxx[pxx == 0] = 0.0000000001
         log_pxx = 10*numpy.log10(pxx*1000)
@@ -94,16 +170,7 @@ class FFTWorker(QtCore.QObject):
         self.newDataReceived.emit(f, log_pxx)
 
         # Determine our new frequency band values, and then update our model to keep the UI synchronized
-        divs = []
-        for band, [lower, upper] in global_vars.FREQ_BANDS.items():
-            freq_filter = (f >= lower) & (f <= upper)
-            band_values = pxx[freq_filter]
-            idx = self.freq_bands_model.match(self.freq_bands_model.index(0,0), QtCore.Qt.ItemDataRole.DisplayRole, band)[0]
-            band_sum = numpy.sum(band_values)
-            pxx_sum = numpy.sum(pxx)
-            if pxx_sum == 0 or band_sum == 0:
-                div = 0
-            else: div = float(band_sum / pxx_sum)
-            divs.append(div)
-            self.freq_bands_model.setValue(idx.siblingAtColumn(1), div)
+        divs = self.band_table.relativePowers(pxx).tolist()
+        for idx, div in zip(self._band_indices, divs):
+            self.freq_bands_model.setValue(idx, div)
         self.bandsUpdated.emit(divs)
\ No newline at end of file
@@ -0,0 +1,27 @@
+## Persistent FFTW wisdom
+
+# FFTW has to plan every transform size before it can run it, which is slow the first time around.
+# The resulting "wisdom" can be exported and imported again later, so we keep it in a local file between sessions,
+# in the same way we keep our settings. With the wisdom loaded, planning a size we've seen before is nearly instant.
+import json
+import pyfftw
+
+# Loads previously saved wisdom, if any. Returns whether anything was loaded.
+def loadWisdom(file_name):
+    try:
+        with open(file_name, 'r') as file:
+            wisdom = json.load(file)
+        # One entry per precision: double, single and long double
+        success = pyfftw.import_wisdom(tuple(entry.encode('ascii') for entry in wisdom))
+    # Can't read file, so we just plan from scratch
+    except (FileNotFoundError, ValueError, TypeError, AttributeError):
+        return False
+    return any(success)
+
+def saveWisdom(file_name):
+    try:
+        wisdom = [entry.decode('ascii') for entry in pyfftw.export_wisdom()]
+        with open(file_name, 'w+') as file:
+            json.dump(wisdom, file)
+    except Exception as err:
+        print("Failed to save FFT wisdom:", err)
@@ -1,9 +1,12 @@
 from PyQt6 import QtCore, QtWidgets, QtGui
 
 class FileTab(QtWidgets.QWidget):
+    MIN_SPEED = 0.5
     directoryChanged = QtCore.pyqtSignal(str)
     activeFileChanged = QtCore.pyqtSignal(str)
     doubleClickedFile = QtCore.pyqtSignal()
+    seekRequested = QtCore.pyqtSignal(float)
+    speedChanged = QtCore.pyqtSignal(float)
 
     def __init__(self, settings):
         super().__init__()
@@ -38,9 +41,51 @@ class FileTab(QtWidgets.QWidget):
         self.stop_button = QtWidgets.QPushButton("Stop")        
         button_layout.addWidget(self.start_button)
         button_layout.addWidget(self.stop_button)
+        # Replay speed as a multiple of real time, from MIN_SPEED up, where 0 sends as fast as the client can take it
+        self.speed_box = QtWidgets.QDoubleSpinBox()
+        self.speed_box.setRange(0, 50)
+        self.speed_box.setSingleStep(0.5)
+        self.speed_box.setSuffix("x")
+        self.speed_box.setSpecialValueText("Unthrottled")
+        self.speed_box.setValue(settings['debug']['speed'])
+        self.speed_box.valueChanged.connect(self.clampSpeed)
+        button_layout.addWidget(QtWidgets.QLabel("Speed"))
+        button_layout.addWidget(self.speed_box)
         button_widget.setLayout(button_layout)
         layout.addWidget(button_widget)
 
+        # Seeking within the file, either by dragging the slider or by typing in a time.
+        # The slider only knows how long the file is once it starts playing, but jumping works before that too,
+        # in which case the replay starts from there.
+        self.playing = False
+        seek_widget = QtWidgets.QWidget()
+        seek_layout = QtWidgets.QHBoxLayout()
+        self.seek_slider = QtWidgets.QSlider(QtCore.Qt.Orientation.Horizontal)
+        self.seek_slider.setEnabled(False)
+        self.seek_slider.sliderReleased.connect(self.seekToSlider)
+        self.seek_slider.valueChanged.connect(self.showSliderPosition)
+        self.position_label = QtWidgets.QLabel()
+        self.jump_box = QtWidgets.QTimeEdit()
+        self.jump_box.setDisplayFormat("HH:mm:ss")
+        self.jump_button = QtWidgets.QPushButton("Jump")
+        self.jump_button.clicked.connect(self.jumpToTime)
+        seek_layout.addWidget(self.seek_slider)
+        seek_layout.addWidget(self.position_label)
+        seek_layout.addWidget(self.jump_box)
+        seek_layout.addWidget(self.jump_button)
+        seek_widget.setLayout(seek_layout)
+        layout.addWidget(seek_widget)
+        self.duration = 0
+        self.showSliderPosition(0)
+
+    # Only lets through speeds we support, bumping anything between unthrottled and the slowest speed up to the latter
+    def clampSpeed(self, speed):
+        if 0 < speed < self.MIN_SPEED:
+            # Setting the value calls us back with the clamped speed
+            self.speed_box.setValue(self.MIN_SPEED)
+            return
+        self.speedChanged.emit(speed)
+
     # This needs to handle switching drives so that it doesn't break the sorting function
     # From what I understand, that means changing the RootPath variable (eg from C: to D:)
     def displayFileBrowser(self):
@@ -53,7 +98,44 @@ class FileTab(QtWidgets.QWidget):
     def notifyFileChange(self, index):
         file = self.file_system.filePath(index)
         self.activeFileChanged.emit(file)
+        # A different file starts from the beginning, unless the one playing is the one we're seeking in
+        if not self.playing:
+            self.seek_slider.setValue(0)
+            self.seekRequested.emit(0.0)
         
     def startFileDisplay(self, index):
         self.notifyFileChange(index)
-        self.doubleClickedFile.emit()
\ No newline at end of file
+        self.doubleClickedFile.emit()
+
+    @staticmethod
+    def formatTime(seconds):
+        seconds = int(seconds)
+        return "%02d:%02d:%02d" % (seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+    # Called once the replay has opened the file, which is when we know how long it is
+    def setDuration(self, duration):
+        self.playing = True
+        self.duration = duration
+        self.seek_slider.setRange(0, int(duration))
+        self.seek_slider.setEnabled(True)
+        self.showSliderPosition(self.seek_slider.value())
+
+    def replayFinished(self):
+        self.playing = False
+        self.seek_slider.setEnabled(False)
+
+    # Follows the replay, unless the slider is being dragged
+    def showPosition(self, seconds):
+        if not self.seek_slider.isSliderDown():
+            self.seek_slider.setValue(int(seconds))
+
+    def showSliderPosition(self, value):
+        self.position_label.setText(self.formatTime(value) + " / " + self.formatTime(self.duration))
+
+    def seekToSlider(self):
+        self.seekRequested.emit(float(self.seek_slider.value()))
+
+    def jumpToTime(self):
+        seconds = QtCore.QTime(0, 0).secsTo(self.jump_box.time())
+        self.seek_slider.setValue(seconds)
+        self.seekRequested.emit(float(seconds))
@@ -0,0 +1,96 @@
+## Streaming filters applied to the incoming data
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+# FilterBank chains the enabled notch, high-pass and band-pass filters into a single set of second-order sections,
+# and filters every channel of a block at once with one sosfilt call. The filter state of every channel is carried
+# over from one block to the next, so the blocks join up seamlessly as if we filtered the whole recording in one go.
+# Filtered blocks come out in the precision of the samples (dtype), but the sections and their state stay in double
+# precision: a low cut-off puts the poles so close to the unit circle that single precision visibly distorts the output.
+# A filter whose frequencies don't fit below the Nyquist frequency of fs can't be designed, so it's left out and
+# reported instead, rather than taking the whole capture down with it.
+class FilterBank():
+    def __init__(self, fs, filter_settings, dtype='float64'):
+        sections = []
+        order = filter_settings['order']
+        nyquist = fs / 2
+        highpass = False
+        bandpass = False
+        if filter_settings['notch_enabled']:
+            freq = filter_settings['notch_freq']
+            if 0 < freq < nyquist:
+                b, a = signal.iirnotch(freq, filter_settings['notch_quality'], fs=fs)
+                sections.append(signal.tf2sos(b, a))
+            else:
+                print("Skipping notch filter: %g Hz is outside of (0, %g) Hz" % (freq, nyquist))
+        if filter_settings['highpass_enabled']:
+            cutoff = filter_settings['highpass_cutoff']
+            if 0 < cutoff < nyquist:
+                sections.append(signal.butter(order, cutoff, 'highpass', fs=fs, output='sos'))
+                highpass = True
+            else:
+                print("Skipping high-pass filter: %g Hz is outside of (0, %g) Hz" % (cutoff, nyquist))
+        if filter_settings['bandpass_enabled']:
+            low = filter_settings['bandpass_low']
+            high = filter_settings['bandpass_high']
+            if 0 < low < high < nyquist:
+                sections.append(signal.butter(order, [low, high], 'bandpass', fs=fs, output='sos'))
+                bandpass = True
+            else:
+                print("Skipping band-pass filter: %g-%g Hz needs 0 < low < high < %g Hz" % (low, high, nyquist))
+        self.dtype = numpy.dtype(dtype)
+        self.sos = numpy.vstack(sections) if sections else None
+        # Whether the filters remove the DC offset, which makes any baseline correction further down unnecessary
+        self.removes_dc = highpass or bandpass
+        self._zi = None
+
+    # Filters a (channels x samples) block, returning a new array
+    def process(self, block):
+        if self.sos is None:
+            return block
+        if self._zi is None:
+            # Start every channel from the steady state for its first sample, so DC offsets don't ring at the start
+            self._zi = signal.sosfilt_zi(self.sos)[:, numpy.newaxis, :] * block[numpy.newaxis, :, 0, numpy.newaxis]
+        filtered, self._zi = signal.sosfilt(self.sos, block, axis=-1, zi=self._zi)
+        return filtered.astype(self.dtype, copy=False)
+
+# Decimator lowers the sample rate of a stream by an integer factor, low-passing it first with an FIR filter
+# (lowpass_taps long) so that nothing above the new Nyquist frequency aliases into the result.
+# Only the outputs we keep are ever computed, which makes this a polyphase decimator: each output sample is the dot
+# product of the filter with the input window ending on it. The last taps-1 input samples and the position of the
+# next output are carried over between blocks, so the stream can be fed in blocks of any length.
+# Decimating without a filter would alias, so we never use fewer than MIN_TAPS taps.
+class Decimator():
+    MIN_TAPS = 3
+
+    def __init__(self, factor, taps, total_channels, dtype='float64'):
+        self.factor = max(int(factor), 1)
+        taps = int(taps)
+        if self.factor > 1:
+            if taps < self.MIN_TAPS:
+                print("Alias filter needs at least %d taps, using %d instead of %d" % (self.MIN_TAPS, self.MIN_TAPS, taps))
+                taps = self.MIN_TAPS
+            coefficients = signal.firwin(taps, 1/self.factor)
+        else:
+            coefficients = numpy.ones(1)
+        # Reversed, so that a forward dot product with the input window computes the convolution
+        self._coefficients = coefficients[::-1].astype(dtype)
+        self._history = numpy.zeros((total_channels, len(coefficients) - 1), dtype=dtype)
+        # Index within the next block of the next sample we output
+        self._phase = 0
+
+    # Decimates a (channels x samples) block, returning a new (channels x outputs) array
+    def process(self, block):
+        if self.factor == 1:
+            return block
+        n = block.shape[1]
+        extended = numpy.concatenate((self._history, block), axis=1)
+        # Window i covers the input ending on the block's sample i
+        windows = sliding_window_view(extended, len(self._coefficients), axis=-1)
+        output = windows[:, self._phase::self.factor] @ self._coefficients
+        self._phase = (self._phase - n) % self.factor
+        if self._history.shape[1] > 0:
+            self._history = extended[:, -self._history.shape[1]:]
+        return output
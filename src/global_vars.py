@@ -19,3 +19,5 @@ CHANNELS = [
 ]
 
 MAX_ERRORS = 5
+
+WISDOM_FILE = "fft_wisdom.json"
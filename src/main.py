@@ -13,12 +13,15 @@ from pyqtgraph import PlotCurveItem, PlotWidget, AxisItem, GridItem, PlotDataIte
 from pyqtgraph.dockarea import Dock, DockArea
 
 from data_parser import DataWorker
+from sample_decoder import DECODERS
 from fft_parser import FFTWorker
+from fft_wisdom import loadWisdom, saveWisdom
+from sample_store import SampleStore
+from filters import FilterBank, Decimator
 import global_vars
-from dvg_ringbuffer import RingBuffer
+import stats
 import numpy
-from time import perf_counter_ns
-import tsdownsample
+from time import perf_counter
 
 if len(sys.argv) > 1 and sys.argv[1] == "-d":
     pyqtgraph.setConfigOption('crashWarning', True)
@@ -27,6 +30,7 @@ from debug_source import DebugWorker
 from serial import SerialHandler
 from file_tab import FileTab
 from real_time_plot import RealTimePlot
+from stats_view import StatsView
 from utils import LogAxis, CustomPlotItem
 
 # MainWindow holds all other windows, initializes the settings, and connects every needed signal to its respective slot.
@@ -52,6 +56,8 @@ class MainWindow(QtWidgets.QMainWindow):
         # Load settings
         self.settings = {}
         self.settings_handler = SettingsHandler("settings.json", self.settings)
+        # Load FFTW plans from previous sessions, so the spectrum doesn't stall while planning
+        loadWisdom(global_vars.WISDOM_FILE)
         
         # Initialize main window
         self.setWindowTitle("Biosemi TCP Reader")
@@ -102,18 +108,45 @@ class MainWindow(QtWidgets.QMainWindow):
         # File replay control
         self.selection_window.file_tab.start_button.clicked.connect(self.graph_window.startCaptureFromFile)
         self.selection_window.file_tab.stop_button.clicked.connect(self.graph_window.stopCapture)
+        # The debug worker's thread is busy replaying, so seeks have to run straight from ours
+        self.selection_window.file_tab.seekRequested.connect(self.graph_window.debug_worker.seek, QtCore.Qt.ConnectionType.DirectConnection)
+        self.graph_window.debug_worker.fileOpened.connect(self.selection_window.file_tab.setDuration)
+        self.graph_window.debug_worker.positionChanged.connect(self.selection_window.file_tab.showPosition)
+        self.graph_window.debug_worker.finishedRead.connect(self.selection_window.file_tab.replayFinished)
+
+        # Pipeline settings
+        self.selection_window.decoder_box.textActivated.connect(self.settings_handler.setDecoder)
+        self.selection_window.max_latency_box.valueChanged.connect(self.settings_handler.setMaxLatency)
+        self.selection_window.max_block_box.valueChanged.connect(self.settings_handler.setMaxBlock)
+        self.selection_window.precision_box.textActivated.connect(self.settings_handler.setPrecision)
 
         # Filter settings
-        # self.selection_window.decimating_factor_box.valueChanged.connect(self.settings_handler.setDecimatingFactor)
-        # self.selection_window.decimating_taps_box.valueChanged.connect(self.settings_handler.setLowpassTaps)
+        self.selection_window.notch_checkbox.checkStateChanged.connect(self.settings_handler.setNotchEnabled)
+        self.selection_window.notch_freq_box.valueChanged.connect(self.settings_handler.setNotchFreq)
+        self.selection_window.highpass_checkbox.checkStateChanged.connect(self.settings_handler.setHighpassEnabled)
+        self.selection_window.highpass_cutoff_box.valueChanged.connect(self.settings_handler.setHighpassCutoff)
+        self.selection_window.bandpass_checkbox.checkStateChanged.connect(self.settings_handler.setBandpassEnabled)
+        self.selection_window.bandpass_low_box.valueChanged.connect(self.settings_handler.setBandpassLow)
+        self.selection_window.bandpass_high_box.valueChanged.connect(self.settings_handler.setBandpassHigh)
+        self.selection_window.decimating_factor_box.valueChanged.connect(self.settings_handler.setDecimatingFactor)
+        self.selection_window.decimating_taps_box.valueChanged.connect(self.settings_handler.setLowpassTaps)
 
         # View control
         self.selection_window.rolling_checkbox.checkStateChanged.connect(self.graph_window.setRollingView)
         self.selection_window.rolling_checkbox.checkStateChanged.connect(self.settings_handler.setRollingEnabled)
+        self.selection_window.time_length_box.valueChanged.connect(self.settings_handler.setTimeLength)
+        self.selection_window.history_length_box.valueChanged.connect(self.settings_handler.setHistoryLength)
+        self.selection_window.target_fps_box.valueChanged.connect(self.settings_handler.setTargetFps)
+
+        # Statistics
+        self.graph_window.stats_view.dump_checkbox.checkStateChanged.connect(self.settings_handler.setStatsDumpEnabled)
+        self.graph_window.stats_view.dump_interval_box.valueChanged.connect(self.settings_handler.setStatsDumpInterval)
 
         # FFT settings
         self.selection_window.welch_window_box.valueChanged.connect(self.settings_handler.setWelchWindow)
+        self.selection_window.refresh_rate_box.valueChanged.connect(self.settings_handler.setRefreshRate)
         self.selection_window.fft_checkbox.checkStateChanged.connect(self.settings_handler.setWelchEnabled)
+        self.selection_window.per_channel_checkbox.checkStateChanged.connect(self.settings_handler.setPerChannelEnabled)
 
         # Serial settings
         self.selection_window.serial_port_box.textActivated.connect(self.settings_handler.setSerialPort)
@@ -133,6 +166,7 @@ class MainWindow(QtWidgets.QMainWindow):
         # File view settings
         self.selection_window.file_tab.activeFileChanged.connect(self.settings_handler.setFile)
         self.selection_window.file_tab.directoryChanged.connect(self.settings_handler.setDirectory)
+        self.selection_window.file_tab.speedChanged.connect(self.settings_handler.setReplaySpeed)
         self.selection_window.file_tab.doubleClickedFile.connect(self.graph_window.startCapture)
 
         # Show window
@@ -170,7 +204,7 @@ class MainWindow(QtWidgets.QMainWindow):
             self.freq_bands_model.clear()
         else: 
             data = []
-            for k in global_vars.FREQ_BANDS.keys():
+            for k in self.settings['fft']['bands'].keys():
                 if k == "Alpha":
                     data.append([k, 0, self.settings['threshold']['alpha'], False])
                 else: data.append([k, 0, 1, False])
@@ -211,6 +245,7 @@ class MainWindow(QtWidgets.QMainWindow):
     # Attempts to safely close the program. Doesn't work very reliably right now
     def closeEvent(self, event):
         self.settings_handler.saveSettings()
+        saveWisdom(global_vars.WISDOM_FILE)
         self.graph_window.stopCapture()
         self.graph_window.data_thread.wait(100)
         self.graph_window.fft_thread.wait(100)
@@ -277,6 +312,36 @@ class SelectionWindow(QtWidgets.QTabWidget):
         selection_layout.addWidget(connection_frame)
         connection_frame.setLayout(connection_layout)
 
+        verticalSpacer = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
+        selection_layout.addItem(verticalSpacer) 
+
+        # Pipeline settings
+        pipeline_frame = QtWidgets.QFrame()
+        pipeline_frame.setFrameStyle(QtWidgets.QFrame.Shape.Panel | QtWidgets.QFrame.Shadow.Raised)
+        pipeline_layout = QtWidgets.QFormLayout()
+        self.decoder_box = QtWidgets.QComboBox()
+        self.decoder_box.addItems(list(DECODERS.keys()))
+        idx = self.decoder_box.findText(self.settings['pipeline']['decoder'])
+        if not idx == -1:
+            self.decoder_box.setCurrentIndex(idx)
+        pipeline_layout.addRow(QtWidgets.QLabel("Decoder"), self.decoder_box)
+        self.max_latency_box = QtWidgets.QDoubleSpinBox()
+        self.max_latency_box.setRange(0, 1000)
+        self.max_latency_box.setValue(self.settings['pipeline']['max_latency'])
+        pipeline_layout.addRow(QtWidgets.QLabel("Max block latency [ms]"), self.max_latency_box)
+        self.max_block_box = QtWidgets.QSpinBox()
+        self.max_block_box.setRange(1, 2**20)
+        self.max_block_box.setValue(self.settings['pipeline']['max_block'])
+        pipeline_layout.addRow(QtWidgets.QLabel("Max block [samples]"), self.max_block_box)
+        self.precision_box = QtWidgets.QComboBox()
+        self.precision_box.addItems(["float32", "float64"])
+        idx = self.precision_box.findText(self.settings['pipeline']['precision'])
+        if not idx == -1:
+            self.precision_box.setCurrentIndex(idx)
+        pipeline_layout.addRow(QtWidgets.QLabel("Sample precision"), self.precision_box)
+        pipeline_frame.setLayout(pipeline_layout)
+        selection_layout.addWidget(pipeline_frame)
+
         verticalSpacer = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
         selection_layout.addItem(verticalSpacer) 
         
@@ -317,28 +382,56 @@ class SelectionWindow(QtWidgets.QTabWidget):
         selection_layout.addItem(verticalSpacer) 
 
         # Filter settings
-        # filter_frame = QtWidgets.QFrame()
-        # filter_frame.setFrameStyle(QtWidgets.QFrame.Shape.Panel | QtWidgets.QFrame.Shadow.Raised)
-        # filter_layout = QtWidgets.QVBoxLayout()
-
-        # filter_settings = QtWidgets.QWidget()
-        # filter_settings_layout = QtWidgets.QFormLayout()
-        # self.decimating_factor_box = QtWidgets.QSpinBox()
-        # self.decimating_factor_box.setRange(1, 2**31-1)
-        # self.decimating_factor_box.setValue(self.settings['filter']['decimating_factor'])
-        # filter_settings_layout.addRow(QtWidgets.QLabel("Decimating factor"), self.decimating_factor_box)
-        # self.decimating_taps_box = QtWidgets.QSpinBox()
-        # self.decimating_taps_box.setRange(0, 2**31-1)
-        # self.decimating_taps_box.setValue(self.settings['filter']['lowpass_taps'])
-        # filter_settings_layout.addRow(QtWidgets.QLabel("Alias filter taps"), self.decimating_taps_box)
-        # filter_settings.setLayout(filter_settings_layout)
-
-        # filter_layout.addWidget(filter_settings)
-        # filter_frame.setLayout(filter_layout)
-        # selection_layout.addWidget(filter_frame)
-
-        # verticalSpacer = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
-        # selection_layout.addItem(verticalSpacer) 
+        filter_frame = QtWidgets.QFrame()
+        filter_frame.setFrameStyle(QtWidgets.QFrame.Shape.Panel | QtWidgets.QFrame.Shadow.Raised)
+        filter_layout = QtWidgets.QVBoxLayout()
+        filter_layout.addWidget(QtWidgets.QLabel("Filters"))
+
+        filter_settings = QtWidgets.QWidget()
+        filter_settings_layout = QtWidgets.QFormLayout()
+        self.notch_checkbox = QtWidgets.QCheckBox("Notch [Hz]")
+        self.notch_checkbox.setChecked(self.settings['filter']['notch_enabled'])
+        self.notch_freq_box = QtWidgets.QDoubleSpinBox()
+        self.notch_freq_box.setRange(1, 1000)
+        self.notch_freq_box.setValue(self.settings['filter']['notch_freq'])
+        filter_settings_layout.addRow(self.notch_checkbox, self.notch_freq_box)
+        self.highpass_checkbox = QtWidgets.QCheckBox("High-pass [Hz]")
+        self.highpass_checkbox.setChecked(self.settings['filter']['highpass_enabled'])
+        self.highpass_cutoff_box = QtWidgets.QDoubleSpinBox()
+        self.highpass_cutoff_box.setRange(0.01, 1000)
+        self.highpass_cutoff_box.setValue(self.settings['filter']['highpass_cutoff'])
+        filter_settings_layout.addRow(self.highpass_checkbox, self.highpass_cutoff_box)
+        self.bandpass_checkbox = QtWidgets.QCheckBox("Band-pass [Hz]")
+        self.bandpass_checkbox.setChecked(self.settings['filter']['bandpass_enabled'])
+        bandpass_widget = QtWidgets.QWidget()
+        bandpass_layout = QtWidgets.QHBoxLayout()
+        bandpass_layout.setContentsMargins(0, 0, 0, 0)
+        self.bandpass_low_box = QtWidgets.QDoubleSpinBox()
+        self.bandpass_low_box.setRange(0.01, 1000)
+        self.bandpass_low_box.setValue(self.settings['filter']['bandpass_low'])
+        self.bandpass_high_box = QtWidgets.QDoubleSpinBox()
+        self.bandpass_high_box.setRange(0.01, 1000)
+        self.bandpass_high_box.setValue(self.settings['filter']['bandpass_high'])
+        bandpass_layout.addWidget(self.bandpass_low_box)
+        bandpass_layout.addWidget(self.bandpass_high_box)
+        bandpass_widget.setLayout(bandpass_layout)
+        filter_settings_layout.addRow(self.bandpass_checkbox, bandpass_widget)
+        self.decimating_factor_box = QtWidgets.QSpinBox()
+        self.decimating_factor_box.setRange(1, 2**31-1)
+        self.decimating_factor_box.setValue(self.settings['filter']['decimating_factor'])
+        filter_settings_layout.addRow(QtWidgets.QLabel("Decimating factor"), self.decimating_factor_box)
+        self.decimating_taps_box = QtWidgets.QSpinBox()
+        self.decimating_taps_box.setRange(Decimator.MIN_TAPS, 2**31-1)
+        self.decimating_taps_box.setValue(self.settings['filter']['lowpass_taps'])
+        filter_settings_layout.addRow(QtWidgets.QLabel("Alias filter taps"), self.decimating_taps_box)
+        filter_settings.setLayout(filter_settings_layout)
+
+        filter_layout.addWidget(filter_settings)
+        filter_frame.setLayout(filter_layout)
+        selection_layout.addWidget(filter_frame)
+
+        verticalSpacer = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
+        selection_layout.addItem(verticalSpacer) 
 
         # FFT settings
         fft_frame = QtWidgets.QFrame()
@@ -354,6 +447,13 @@ class SelectionWindow(QtWidgets.QTabWidget):
         self.welch_window_box.setRange(0, 2**31-1)
         self.welch_window_box.setValue(self.settings['fft']['welch_window'])
         fft_settings_layout.addRow(QtWidgets.QLabel("Welch Window [samples]"), self.welch_window_box)
+        self.refresh_rate_box = QtWidgets.QDoubleSpinBox()
+        self.refresh_rate_box.setRange(0.1, 120)
+        self.refresh_rate_box.setValue(self.settings['fft']['refresh_rate'])
+        fft_settings_layout.addRow(QtWidgets.QLabel("Max refresh rate [Hz]"), self.refresh_rate_box)
+        self.per_channel_checkbox = QtWidgets.QCheckBox("Per-channel spectra")
+        self.per_channel_checkbox.setChecked(self.settings['fft']['per_channel'])
+        fft_settings_layout.addRow(self.per_channel_checkbox)
         fft_settings.setLayout(fft_settings_layout)
 
         fft_layout.addWidget(fft_settings)
@@ -386,6 +486,23 @@ class SelectionWindow(QtWidgets.QTabWidget):
 
         view_layout.addWidget(self.rolling_checkbox)
 
+        view_settings = QtWidgets.QWidget()
+        view_settings_layout = QtWidgets.QFormLayout()
+        self.time_length_box = QtWidgets.QDoubleSpinBox()
+        self.time_length_box.setRange(0.5, 600)
+        self.time_length_box.setValue(self.settings['view']['time_length'])
+        view_settings_layout.addRow(QtWidgets.QLabel("Time window [s]"), self.time_length_box)
+        self.history_length_box = QtWidgets.QSpinBox()
+        self.history_length_box.setRange(0, 24*3600)
+        self.history_length_box.setValue(self.settings['view']['history_length'])
+        view_settings_layout.addRow(QtWidgets.QLabel("History [s]"), self.history_length_box)
+        self.target_fps_box = QtWidgets.QSpinBox()
+        self.target_fps_box.setRange(1, 240)
+        self.target_fps_box.setValue(self.settings['view']['target_fps'])
+        view_settings_layout.addRow(QtWidgets.QLabel("Target FPS"), self.target_fps_box)
+        view_settings.setLayout(view_settings_layout)
+        view_layout.addWidget(view_settings)
+
         view_frame.setLayout(view_layout)
         selection_layout.addWidget(view_frame)
 
@@ -440,7 +557,7 @@ class SelectionWindow(QtWidgets.QTabWidget):
         self.freq_bands_view.setSizePolicy(QtWidgets.QSizePolicy.Policy.Maximum, QtWidgets.QSizePolicy.Policy.Minimum)
         self.freq_bands_view.setMaximumWidth(300)
         self.freq_bands_view.setMaximumHeight(300)
-        total_bands = len(global_vars.FREQ_BANDS.keys())
+        total_bands = len(self.settings['fft']['bands'])
         band_width = 0.8
         color = pyqtgraph.mkColor("#808080")
         self.freq_bands_chart = BarGraphItem(height=0.1, width=band_width, x=range(total_bands), y0=0, brushes=[color]*total_bands)
@@ -448,12 +565,12 @@ class SelectionWindow(QtWidgets.QTabWidget):
         grey = pyqtgraph.mkColor("#d4d4d4")
         ax.setTextPen(grey)
         ax.setPen(grey)
-        ax.setTicks([[(i, band) for i,band in enumerate(global_vars.FREQ_BANDS.keys())],[]])
+        ax.setTicks([[(i, band) for i,band in enumerate(self.settings['fft']['bands'].keys())],[]])
         ax = self.freq_bands_view.getAxis('left')
         ax.setTextPen(grey)
         ax.setPen(grey)
         self.freq_bands_view.addItem(self.freq_bands_chart)
-        self.freq_bands_view.setRange(xRange=[0-(band_width/1.5),4+(band_width/1.5)], yRange=[0,1.05], disableAutoRange=True, padding=0)
+        self.freq_bands_view.setRange(xRange=[0-(band_width/1.5),(total_bands-1)+(band_width/1.5)], yRange=[0,1.05], disableAutoRange=True, padding=0)
         self.freq_bands_view.setMouseEnabled(x=False,y=False)
         self.freq_bands_view.hideButtons()
         alpha_threshold = self.settings['threshold']['alpha']
@@ -481,7 +598,7 @@ class SelectionWindow(QtWidgets.QTabWidget):
         indicator_frame.setFrameStyle(QtWidgets.QFrame.Shape.Panel | QtWidgets.QFrame.Shadow.Raised)
         indicator_layout = QtWidgets.QFormLayout()
         self.band_indicators = []
-        for freq_band in global_vars.FREQ_BANDS.keys():
+        for freq_band in self.settings['fft']['bands'].keys():
             indicator = QtWidgets.QLabel(freq_band + " under threshold.")
             indicator_img = QtWidgets.QLabel()
             indicator_img.setPixmap(self.black_icon)
@@ -496,18 +613,19 @@ class SelectionWindow(QtWidgets.QTabWidget):
         self.addTab(measurements_window, "Measurements")
 
     # Updates indicators when the model signals that it has surpassed the set threshold
-    def updateThresholdDisplay(self, index, status):
+    def updateThresholdDisplay(self, index, status, detected_at):
         band = self.band_indicators[index.row()][0].text().split()[0]
         color = pyqtgraph.mkColor("#808080")
+        brushes = [color]*len(self.band_indicators)
         if status:
             self.band_indicators[index.row()][0].setText(band + " over threshold")
             self.band_indicators[index.row()][1].setPixmap(self.red_icon)
-            red = pyqtgraph.mkColor("#ff0000")
-            self.freq_bands_chart.setOpts(brushes=[color,color,red,color,color])
+            brushes[index.row()] = pyqtgraph.mkColor("#ff0000")
+            self.freq_bands_chart.setOpts(brushes=brushes)
         else:
             self.band_indicators[index.row()][0].setText(band + " under threshold")
             self.band_indicators[index.row()][1].setPixmap(self.black_icon)
-            self.freq_bands_chart.setOpts(brushes=[color]*5)
+            self.freq_bands_chart.setOpts(brushes=brushes)
 
         # Send signal to connected serial output (e.g Arduino)
         if band == "Alpha":
@@ -515,6 +633,7 @@ class SelectionWindow(QtWidgets.QTabWidget):
                 self.sendEnableSignal()
             else:
                 self.sendDisableSignal()
+            stats.pipeline.record("threshold_to_serial", perf_counter() - detected_at)
 
     # TODO: Expose this in the configuration side so that you can specify the signals
     def sendDisableSignal(self):
@@ -560,6 +679,11 @@ class GraphWindow(QtWidgets.QWidget):
         self.setLayout(self.graph_layout)
         self.plots = []
         self.initializeWorker()
+        # Refresh the statistics once a second, dumping them every so often if enabled
+        self._last_stats_dump = perf_counter()
+        self.stats_timer = QtCore.QTimer()
+        self.stats_timer.timeout.connect(self.updateStats)
+        self.stats_timer.start(1000)
 
     # Toggles displaying the FFT window
     def toggleFFT(self, checked):
@@ -600,14 +724,39 @@ class GraphWindow(QtWidgets.QWidget):
     
         dock_2.addWidget(self.fft_plot_widget)
 
+        dock_3 = Dock("Statistics")
+        dock_area.addDock(dock_3, 'right', dock_2)
+        self.stats_view = StatsView(self.settings)
+        dock_3.addWidget(self.stats_view)
+
         self.graph_layout.addWidget(dock_area)
 
     # Initializes PlotDataItems in both our separate plot widget and GraphWindow
     def initializeGraphs(self):
-        fs = self.settings['biosemi']['fs']
+        # Every capture gets its own statistics
+        stats.pipeline.reset()
+        # The plot and the FFT both work on the decimated stream
+        decimating_factor = max(self.settings['filter']['decimating_factor'], 1)
+        full_fs = self.settings['biosemi']['fs']
+        fs = full_fs / decimating_factor
         total_channels = self.electrodes_model.rowCount()
-        time_length = 8 # Data buffer length in seconds, consider exposing to UI
-        self.buffer_size = int(fs*time_length)
+        self.buffer_size = int(fs*self.settings['view']['time_length'])
+
+        # Create the sample stores shared by the data worker and every consumer. The decimated store holds enough for
+        # the plot and the Welch window, with some slack so readers aren't lapped by the writer while they're working.
+        welch_window = self.settings['fft']['welch_window'] // decimating_factor
+        store_capacity = int(max(self.buffer_size, welch_window) + 2*fs)
+        dtype = self.settings['pipeline']['precision']
+        self.decimated_store = SampleStore(total_channels, store_capacity, dtype)
+        if decimating_factor > 1:
+            # Nothing reads the full rate stream for now, so we don't keep it
+            self.worker.setSampleStore(None, self.decimated_store)
+        else:
+            self.worker.setSampleStore(self.decimated_store)
+        # The data worker filters once, so that every consumer gets the filtered data
+        filter_bank = FilterBank(full_fs, self.settings['filter'], dtype=dtype)
+        self.worker.setFilterBank(filter_bank)
+        self.fft_worker.setSampleStore(self.decimated_store)
 
         # Select active channels and initialize time-domain plot
         active_channels = []
@@ -615,10 +764,13 @@ class GraphWindow(QtWidgets.QWidget):
             idx = self.electrodes_model.index(i,1)
             if self.electrodes_model.itemFromIndex(idx).data(): 
                 active_channels.append(i)
-        self.plot_widget.initializeGraphs(fs, total_channels, self.buffer_size, self.rolling_view, active_channels)
+        # A high-pass or band-pass filter already removes the DC offset, so the plot doesn't need to
+        remove_baseline = not filter_bank.removes_dc
+        history_length = int(fs*self.settings['view']['history_length'])
+        self.plot_widget.initializeGraphs(fs, total_channels, self.buffer_size, self.rolling_view, active_channels,
+                                          self.decimated_store, remove_baseline, history_length, self.settings['view']['target_fps'])
 
         # Initialize plot for FFT graphing
-        self._last_fft_update = 0
         self.fft_plot = PlotDataItem(pen=pyqtgraph.hsvColor(1/(total_channels), 0.8, 0.9), skipFiniteCheck=True)
         self.fft_plot_widget.addItem(self.fft_plot)
         padding = 0
@@ -687,7 +839,6 @@ class GraphWindow(QtWidgets.QWidget):
         self.debug_worker.finished.connect(self.debug_thread.quit)
         self.debug_worker.finished.connect(self.debug_worker.deleteLater)
         self.debug_thread.finished.connect(self.debug_thread.deleteLater)
-        self.debug_worker.finishedRead.connect(self.stopCapture)
         self.debug_thread.start()
         self.data_thread = QtCore.QThread()
         self.worker = DataWorker(self.settings, self.electrodes_model, self.freq_bands_model, self.plots)
@@ -695,8 +846,10 @@ class GraphWindow(QtWidgets.QWidget):
         self.worker.finished.connect(self.data_thread.quit)
         self.worker.finished.connect(self.worker.deleteLater)
         self.data_thread.finished.connect(self.data_thread.deleteLater)
+        # The data worker can finish on its own when the connection closes, so it goes through stopCapture as well
+        self.worker.finishedCapture.connect(self.stopCapture)
         self.worker.finishedCapture.connect(self.cleanup)
-        self.worker.newDataReceived.connect(self.plot_widget.updatePlots)
+        self.worker.decimatedDataReceived.connect(self.plot_widget.updatePlots)
 
         self.fft_thread = QtCore.QThread()
         self.fft_worker = FFTWorker(self.settings, self.electrodes_model, self.freq_bands_model)
@@ -704,21 +857,33 @@ class GraphWindow(QtWidgets.QWidget):
         self.fft_worker.finished.connect(self.fft_thread.quit)
         self.fft_worker.finished.connect(self.fft_worker.deleteLater)
         self.fft_thread.finished.connect(self.fft_thread.deleteLater)
-        self.worker.welchBufferChanged.connect(self.fft_worker.updateBuffers)
-        self.worker.triggerFFT.connect(self.fft_worker.plotFFT)
+        self.worker.triggerFFT.connect(self.fft_worker.requestFFT)
         self.worker.finished.connect(self.fft_worker.terminate)
+        self.worker.finishedCapture.connect(self.fft_worker.stopScheduler)
         self.fft_worker.newDataReceived.connect(self.updateFFTPlot)
+        self.fft_worker.latencyUpdated.connect(self.updateFFTLatency)
         self.data_thread.start()
         self.fft_thread.start()
 
-    # Requests redraw of the FFT plot with the data sent in buffer by the rate specified by fft_rate
-    # We could reduce signal overhead by moving this pseudo-timer to the FFT thread.
+    # Redraws the FFT plot with the data sent in buffer. The FFT worker already limits how often this happens.
     def updateFFTPlot(self, f, pxx):
-        self.fft_rate = 15
-        if perf_counter_ns() < self._last_fft_update + ((10**9)/self.fft_rate):
+        # Results can still arrive after the capture stopped and the plot was cleaned up
+        if not self.is_capturing:
             return
         self.fft_plot.setData(y=pxx, x=f)
-        self._last_fft_update = perf_counter_ns()
+
+    # Shows the latest pipeline statistics, and dumps them to a file when it's time to
+    def updateStats(self):
+        snapshot = stats.pipeline.snapshot()
+        self.stats_view.showSnapshot(snapshot)
+        stats_settings = self.settings['stats']
+        if stats_settings['dump_enabled'] and perf_counter() - self._last_stats_dump >= stats_settings['dump_interval']:
+            stats.StatsDumper(stats_settings['dump_file'], stats_settings['dump_format']).dump(snapshot)
+            self._last_stats_dump = perf_counter()
+
+    # Shows how far behind the PSD is running, as reported by the FFT worker
+    def updateFFTLatency(self, latency, rate):
+        self.fft_plot_widget.setTitle("Power spectral density graph (%.0f ms latency, %.1f Hz)" % (latency*1000, rate))
 
     # Toggles usage of rolling view (updates left to right, overwriting instead of scrolling the view)
     def setRollingView(self, enable):
@@ -816,7 +981,8 @@ class TableModel(QtCore.QAbstractTableModel):
 # Table must be defined such that there are 4 columns, with the third column being the thresholds, and the fourth being
 # whether the threshold is currently active or not (to prevent emit spam)
 class FreqTableModel(TableModel):
-    thresholdChanged = QtCore.pyqtSignal(QtCore.QModelIndex, bool)
+    # Also carries when the change was detected (from perf_counter), so we can tell how long it takes to act on it
+    thresholdChanged = QtCore.pyqtSignal(QtCore.QModelIndex, bool, float)
 
     def __init__(self, data, header):
         super().__init__(data, header)
@@ -825,18 +991,18 @@ class FreqTableModel(TableModel):
         self.setData(index, value, role)
         if not self.data(index.siblingAtColumn(3)).value():
             if value > self.data(index.siblingAtColumn(2)).value():
-                self.thresholdChanged.emit(index, True)
+                self.thresholdChanged.emit(index, True, perf_counter())
                 self.setData(index.siblingAtColumn(3), True)
                 return
         elif value < self.data(index.siblingAtColumn(2)).value():
-            self.thresholdChanged.emit(index, False)
+            self.thresholdChanged.emit(index, False, perf_counter())
             self.setData(index.siblingAtColumn(3), False)
 
     # Allow us to reset the threshold state when starting a new capture
     def setThresholdState(self, row, state):
         idx = self.index(row, 3)
         self.setData(idx, state)
-        self.thresholdChanged.emit(idx, False)
+        self.thresholdChanged.emit(idx, False, perf_counter())
 
 app = QtWidgets.QApplication(sys.argv)
 window = MainWindow()
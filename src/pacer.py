@@ -0,0 +1,39 @@
+## Pacing of the debug sources, so they send samples at the rate a real device would
+
+from time import sleep, perf_counter
+
+# Sleeping for the length of each packet after sending it ignores how long producing and sending it took, so the
+# rate slowly drifts below fs. Pacer instead works out the deadline of every packet from when the stream started,
+# and only sleeps until that deadline, so any time spent working is taken out of the sleep. If we fall behind, the
+# following packets go out without sleeping until we've caught up, but never more than max_lag seconds worth of them:
+# past that we give up on the backlog, rather than flooding the client in one burst.
+# The speed multiplies the rate, so 10 replays ten times faster than real time, and 0 doesn't wait at all.
+class Pacer():
+    def __init__(self, fs, speed=1.0, max_lag=1.0):
+        self.fs = fs
+        self.max_lag = max_lag
+        self.speed = speed
+        self.start()
+
+    # Starts counting deadlines from now
+    def start(self):
+        self._start = perf_counter()
+        self._sent = 0
+
+    # Changing the speed starts counting again, so that what we sent before doesn't count at the new rate
+    def setSpeed(self, speed):
+        if speed != self.speed:
+            self.speed = speed
+            self.start()
+
+    # Waits until it's time to send what follows the given amount of samples
+    def wait(self, samples):
+        self._sent += samples
+        if self.speed <= 0:
+            return
+        deadline = self._start + self._sent / (self.fs * self.speed)
+        delay = deadline - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        elif -delay > self.max_lag:
+            self.start()
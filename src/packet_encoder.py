@@ -0,0 +1,35 @@
+## Encoder that turns channel samples into raw ActiView packets, the reverse of sample_decoder
+
+import numpy
+
+# Packs (channels, samples) blocks of integers into the ActiView wire layout: 3-byte little-endian samples,
+# interleaved so that the first sample of every channel comes first, then the second sample of every channel, and so on.
+# Values are truncated to their lower 24 bits, like the device does. As with the decoders, the output buffer is
+# allocated once and reused across calls, so the returned bytes are only valid until the next call to encode.
+class PacketEncoder():
+    def __init__(self, total_channels, max_samples=512):
+        self.total_channels = total_channels
+        self.max_samples = 0
+        self._allocate(max_samples)
+
+    # Grows the reusable buffers so they can hold the given amount of samples per channel
+    def _allocate(self, samples):
+        self.max_samples = samples
+        self._values = numpy.empty((samples, self.total_channels), dtype='<i4')
+        self._out = numpy.empty((samples, self.total_channels, 3), dtype='uint8')
+
+    # Returns a memoryview over the encoded block
+    def encode(self, block):
+        n = block.shape[1]
+        if n > self.max_samples:
+            self._allocate(n)
+        values = self._values[:n]
+        out = self._out[:n]
+        # Transposing interleaves the channels, and the explicit little-endian layout puts the lower 3 bytes first
+        numpy.copyto(values, block.T, casting='unsafe')
+        out[:] = values.view('uint8').reshape(n, self.total_channels, 4)[:, :, :3]
+        return memoryview(out.reshape(-1))
+
+# Encodes a whole block in one go, for when there's no buffer worth keeping around
+def encodePackets(block):
+    return bytes(PacketEncoder(block.shape[0], block.shape[1]).encode(block))
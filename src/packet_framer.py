@@ -0,0 +1,53 @@
+## Stream framing for the ActiView TCP connection
+
+# TCP gives us a byte stream, not packets, so a single recv() can end halfway through a packet.
+# PacketFramer reads straight into a preallocated buffer with recv_into, keeps any trailing
+# partial packet around for the next read, and hands out whole packets as memoryviews into that
+# same buffer, so no bytes are copied on the way to the decoder.
+#
+# The buffer is treated as a ring of packet-sized slots. Once there isn't a full slot left at the end,
+# the leftover partial packet (always smaller than one packet) is moved back to the start.
+class PacketFramer():
+    def __init__(self, frame_size, slots=8):
+        self.frame_size = frame_size
+        self.slots = max(slots, 2)
+        self._buffer = bytearray(self.frame_size * self.slots)
+        self._view = memoryview(self._buffer)
+        # Bytes between _start and _end have been received but not yet handed out
+        self._start = 0
+        self._end = 0
+        self.bytes_received = 0
+
+    # Number of bytes currently held back as an incomplete packet
+    def pending(self):
+        return self._end - self._start
+
+    # Move the partial packet back to the beginning of the buffer, so we have room for at least one more packet
+    def _compact(self):
+        leftover = self._end - self._start
+        if leftover:
+            self._view[:leftover] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = leftover
+
+    # Receives whatever the socket has available and returns a memoryview over all the whole packets it completed.
+    # The view may be empty if we only got part of a packet, and it is only valid until the next call,
+    # as the underlying memory gets reused. Returns None when the connection has been closed.
+    def readFrames(self, sock):
+        if len(self._buffer) - self._end < self.frame_size:
+            self._compact()
+        received = sock.recv_into(self._view[self._end:])
+        if received == 0:
+            return None
+        self._end += received
+        self.bytes_received += received
+
+        frames = (self._end - self._start) // self.frame_size
+        frames_end = self._start + frames * self.frame_size
+        frame_view = self._view[self._start:frames_end]
+        self._start = frames_end
+        # Nothing left over, so the next read can start from the beginning of the buffer again
+        if self._start == self._end:
+            self._start = 0
+            self._end = 0
+        return frame_view
@@ -1,10 +1,11 @@
-from pyqtgraph import PlotWidget, PlotCurveItem, PlotItem, InfiniteLine
+from pyqtgraph import PlotWidget, PlotItem, InfiniteLine
 import pyqtgraph
-from dvg_ringbuffer import RingBuffer
+from PyQt6 import QtCore
 from time import perf_counter_ns
 import numpy
-import tsdownsample
-from utils import RollingRingBuffer
+from utils import MultiCurveItem
+from downsample import MinMaxCache, MinMaxPyramid
+import stats
 
 # Custom class which allows us to plot the incoming data in real time in a somewhat optimized way,
 # allowing selection and deselection of channels and reference as it happens.
@@ -20,135 +21,238 @@ class RealTimePlot(PlotWidget):
         self._init = False
         self.ref_channel = -1
 
-    # Initializes PlotCurveItems that will hold our data for each channel, as well as every single
-    # ring buffer used to store the data.
-    def initializeGraphs(self, fs, total_channels, buffer_size, rolling_view, active_channels):
+    # Initializes the curve item that draws every channel at once. The data itself lives in the
+    # sample store shared with the other consumers, which needs to hold at least buffer_size samples.
+    # remove_baseline enables centering the rolling view, which is unnecessary if the data is already high-passed.
+    # The scrolling view also keeps a min/max pyramid of the last history_length samples, so it can be zoomed out
+    # beyond what the store holds. The plot is redrawn target_fps times per second.
+    def initializeGraphs(self, fs, total_channels, buffer_size, rolling_view, active_channels, sample_store, remove_baseline=True,
+                         history_length=0, target_fps=30):
+        self.fs = fs
+        self.remove_baseline = remove_baseline
+        self.sample_store = sample_store
         self.buffer_size = buffer_size
-        self._last_update = 0
-        self._received = 0
+        self._head = 0
+        self._frame_head = 0
+        self._frame_view = None
+        self._dirty = True
+        self._frame_budget = (10**9)/target_fps
+        # Number of pixels each point is binned over, which we raise whenever frames overrun their budget
+        self._detail = 1
+        self.max_detail = 8
         self.offset_factor = 1
         self.avgs = numpy.zeros(total_channels)
-        self.time_buffer = RingBuffer(capacity=self.buffer_size, dtype='float64')
+        self._sums = numpy.zeros(total_channels)
+        self._sum_head = 0
+        self.minmax = MinMaxCache(total_channels, self.buffer_size, dtype=sample_store.dtype)
         self.rolling_view = rolling_view
+        self.pyramid = None
+        if not self.rolling_view:
+            self.pyramid = MinMaxPyramid(total_channels, max(history_length, self.buffer_size), dtype=sample_store.dtype)
+            self.pyramid.reset(0, self.ref_channel)
         self.active_channels = active_channels
-        # Generate plots for time-domain graphing
-        self.plots = []
-        self.buffers = []
+        # Generate the curve for time-domain graphing, with a color for each channel
+        pens = []
         for i in range(total_channels):
             color = pyqtgraph.hsvColor(i/(total_channels), 0.8, 0.9)
-            plot = PlotCurveItem(pen=pyqtgraph.mkPen(color=color, width=1), skipFiniteCheck=True, clickable=True)
-            plot.sigClicked.connect(self.autoscaleToData)
-            plot.setSkipFiniteCheck(True)
-            plot.setSegmentedLineMode('on')
-            self.addItem(plot)
-            self.plots.append(plot)
-            if(self.rolling_view):
-                buffer = RollingRingBuffer(capacity=self.buffer_size, dtype='float64')
-            else:
-                buffer = RingBuffer(capacity=self.buffer_size, dtype='float64')
-            self.buffers.append(buffer)
+            pens.append(pyqtgraph.mkPen(color=color, width=1))
+        self.curve = MultiCurveItem(pens)
+        self.curve.sigClicked.connect(self.autoscaleToData)
+        self.addItem(self.curve)
         if self.rolling_view:
-            self.time_buffer.extend(range(self.buffer_size))
             self.roll_line = InfiniteLine(pen='r')
             self.addItem(self.roll_line)
-            self.setLimits(xMin=self.time_buffer[0], xMax=self.time_buffer[-1])
+            self.setLimits(xMin=0, xMax=self.buffer_size - 1)
         self._init = True
+        self.frame_timer = QtCore.QTimer()
+        self.frame_timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self.frame_timer.timeout.connect(self.renderFrame)
+        self.frame_timer.start(int(1000/target_fps))
 
-    # Removes all plots as well as the line used to show the rolling view progress
+    # Removes the curve as well as the line used to show the rolling view progress
     def cleanup(self):
         print("Cleaning up")
         self.is_capturing = False
-        for plot in self.plots:
-            self.removeItem(plot)
-            plot.deleteLater()
+        self.frame_timer.stop()
+        self.frame_timer.deleteLater()
+        self.removeItem(self.curve)
+        self.curve.deleteLater()
         if self.rolling_view:
             self.removeItem(self.roll_line)
             self.roll_line.deleteLater()
         self._init = False
 
-    # Hides the plots that are not currently being used based on the currently active channels in the model
+    # Sets the channels to draw based on the currently active channels in the model.
+    # Deselected channels simply drop out of the curve on the next update.
     def setActiveChannels(self, channels, total_channels):
         self.active_channels = channels
-        if self._init:
-            for i in range(total_channels):
-                if i in channels:
-                    self.plots[i].show()
-                else: self.plots[i].hide()
+        self._dirty = True
+        if self._init and len(channels) == 0:
+            self.curve.clear()
 
     def setReferenceChannel(self, channel):
         self.ref_channel = channel
+        # The pyramid holds referenced values, so only what the store still holds can be recovered
+        if self._init and self.pyramid is not None:
+            self.pyramid.reset(self.sample_store.oldest(), channel)
+        self._dirty = True
 
-    # Slot that receives the data from the data reception thread, does some processing, and plots it
-    # This function is throttled by the update_rate variable, in order to not overwhelm the system,
-    # as data often comes in much faster than what we need to make a smooth plot.
-    def updatePlots(self, data, time_range):
-        self.update_rate = 30
-
-        if not self.rolling_view:
-            # Scrolling faster than our update rate makes the graphing feel smoother
-            self.scroll_rate = 30
-            self.time_buffer.extend(time_range)
-            self._received += 1
-            if perf_counter_ns() > self._last_update + ((10**9)/self.scroll_rate):
-                # Scrolls our view when data starts moving out of range, based on how many packets we've received
-                # since the last scroll update
-                if self.time_buffer.is_full:
-                    time_unit = time_range[1] - time_range[0]
-                    self.getViewBox().translateBy(x=(time_range[-1] - time_range[0] + time_unit)*self._received)
-                    self.setLimits(xMin=self.time_buffer[0], xMax=self.time_buffer[-1])
-                self._received = 0
-        
-        # Fill buffers with the new data
-        # TODO: Rethink this, the reference should definitely not be applied directly to our storage
-        if self.ref_channel != -1:
-            ref = data[self.ref_channel]
+    # Keeps the mean of every channel over the samples in view up to date, from running sums over the window.
+    # Each frame only adds the samples that came in and takes out the ones that left, instead of averaging everything.
+    def _updateBaseline(self, head):
+        start = max(head - self.buffer_size, 0)
+        old_start = max(self._sum_head - self.buffer_size, 0)
+        if self.sample_store.isValid(old_start):
+            self._sums += numpy.sum(self.sample_store.view(self._sum_head, head), axis=1)
+            self._sums -= numpy.sum(self.sample_store.view(old_start, start), axis=1)
         else:
-            ref = 0
-        for i, channel in enumerate(data):
-            self.buffers[i].extend((channel - ref) - self.avgs[i])
+            # We fell too far behind to know which samples left the window, so we start over from what's in view
+            self._sums = numpy.sum(self.sample_store.view(start, head), axis=1, dtype='float64')
+        self._sum_head = head
+        if head > start:
+            means = self._sums / (head - start)
+            # The mean of a difference is the difference of the means, so the reference doesn't need its own sums
+            self.avgs = means - (means[self.ref_channel] if self.ref_channel != -1 else 0)
 
-        # Only request to draw the data at our specified update rate
-        # This could potentially be completely replaced by a QTimer
-        if perf_counter_ns() < self._last_update + ((10**9)/self.update_rate):
+    # Slot that is notified by the data reception thread whenever new samples reach the sample store.
+    # All it does is note how far the data goes, the drawing happens once per frame in renderFrame.
+    # Blocks carry the index of their first sample, and time values are only ever derived from these indices
+    # (and fs) for the points we actually draw.
+    def updatePlots(self, start_sample, count):
+        stats.pipeline.emit_queue.received()
+        # We only read up to the samples we've been notified about, as the store may already hold a few more
+        self._head = start_sample + count
+
+    # Called by our frame timer, this takes in whatever data arrived since the last frame and draws it.
+    # Preparing a frame must fit in half of the frame time, as Qt still has to paint it afterwards, so whenever
+    # it doesn't we halve the detail of the plot by binning twice as many samples per point, and restore it
+    # once frames are well within budget again.
+    def renderFrame(self):
+        if not self._init:
             return
-        self._last_update = perf_counter_ns()
-
-        # If rolling view, then we want to draw the scrolling red line, as well as try to lump the data together
-        # TODO: This method for lumping is not great and often takes too long to stabilize, reconsider
-        if self.rolling_view: 
-            self.roll_line.setPos(self.buffers[0]._idx_L)
-            if self.buffers[0]._idx_L >= self.buffer_size-(4*data.shape[1]):
-                for channel in range(len(self.buffers)):
-                    self.avgs[channel] = numpy.average(self.buffers[channel] + self.avgs[channel])
-
-        # Determine the pixel size of our data so that we can properly bin it for downsampling
-        time_unit = self.time_buffer[1] - self.time_buffer[0]
-        (w,h) = self.getViewBox().viewPixelSize()
-        [[xmin, xmax], [ymin, ymax]] = self.getViewBox().viewRange()
-        block_size = int(numpy.ceil(w / time_unit))
-        num_bin = int(numpy.ceil((len(self.time_buffer) // block_size)/2.) * 2)
-        if num_bin < 3:
-            num_bin = 3
+        head = self._head
+        advanced = head - self._frame_head
+        view_range = self.getViewBox().viewRange()
+        if advanced == 0 and not self._dirty and view_range == self._frame_view:
+            return
+        frame_start = perf_counter_ns()
+        # Samples that got overwritten before we drew them are gone for good
+        if not self.sample_store.isValid(self._frame_head):
+            stats.pipeline.count("store_laps")
+        self._frame_head = head
+        self._dirty = False
+
+        if not self.rolling_view:
+            self.pyramid.update(self.sample_store, head)
+            # Scrolls our view when data starts moving out of range, based on how many samples went past
+            # the end of our buffer since the last frame
+            overflow = head - max(head - advanced, self.buffer_size)
+            if overflow > 0:
+                # Widen the limits first, or they would clamp the scroll to where the previous frame ended
+                self.setLimits(xMin=self.pyramid.oldest()/self.fs, xMax=(head - 1)/self.fs)
+                self.getViewBox().translateBy(x=overflow/self.fs)
+
+        self.drawFrame()
+        self._frame_view = self.getViewBox().viewRange()
+
+        elapsed = perf_counter_ns() - frame_start
+        stats.pipeline.record("plot_frame", elapsed / 10**9)
+        if elapsed > self._frame_budget/2:
+            stats.pipeline.count("plot_overruns")
+            if self._detail < self.max_detail:
+                self._detail *= 2
+        elif elapsed < self._frame_budget/8 and self._detail > 1:
+            self._detail //= 2
+
+    def drawFrame(self):
+        # If rolling view, then we want to draw the red line at the write head, as well as center every channel
+        # on its mean. The view is drawn straight from the store, with each sample placed at its position in a ring
+        # of buffer_size samples, so new data overwrites the oldest data from left to right.
+        if self.rolling_view:
+            pos = self._head % self.buffer_size
+            self.roll_line.setPos(pos)
+            if self.remove_baseline:
+                self._updateBaseline(self._head)
 
         # Plot the data based on the currently active channels
         # If no channels are selected, we don't need to plot anything.
         if len(self.active_channels) == 0:
             return
-        # Loop through active channels and plot only the ones we want
-        for i, channel in enumerate(self.active_channels):
-            buffer = self.buffers[channel].__array__() - self.offset_factor*i
-            if not ((buffer >= ymin) & (buffer <= ymax)).any():
-                continue
-            time = self.time_buffer.__array__()
-            view = tsdownsample.MinMaxLTTBDownsampler().downsample(buffer, n_out=num_bin, parallel=True)
-            clip = numpy.clip(buffer[view], a_min=ymin, a_max=ymax)
-            self.plots[channel].setData(y=clip, x=time[view])
+
+        # Determine how many samples fall in a pixel, so that we bin the data one pixel at a time.
+        # The rolling view is laid out in samples, while the scrolling view is laid out in seconds.
+        time_unit = 1 if self.rolling_view else 1/self.fs
+        (w,h) = self.getViewBox().viewPixelSize()
+        [[xmin, xmax], [ymin, ymax]] = self.getViewBox().viewRange()
+        block_size = int(numpy.ceil(w / time_unit)) * self._detail
+        # Channels are stacked on top of each other by drawing each one with its own offset,
+        # so the data itself never has to be shifted
+        channels = numpy.asarray(self.active_channels)
+        offsets = -(self.avgs[channels] + self.offset_factor*numpy.arange(len(channels)))
+        start = self._head - min(self._head, self.buffer_size)
+        # The view range picks up rounding errors from every scroll, so we round rather than truncate, and only switch
+        # to the history once the view reaches at least a whole bin past the store, so the trace doesn't flicker
+        # between the two at the edge
+        view_start = int(round(xmin / time_unit))
+        if self.pyramid is not None and view_start < start - self.pyramid.base_bin:
+            # Zoomed out past the last buffer_size samples, so we draw from the history instead
+            level = self.pyramid.levelFor(block_size, view_start)
+            positions, values = self.pyramid.extrema(channels, view_start, int(numpy.ceil(xmax / time_unit)), level)
+            if len(positions) == 0:
+                self.curve.clear()
+                return
+            visible = (numpy.max(values, axis=1) + offsets >= ymin) & (numpy.min(values, axis=1) + offsets <= ymax)
+            values = values[visible]
+            idx = numpy.broadcast_to(positions, values.shape)
+        else:
+            # Skip the channels that are entirely out of view before we gather any of their data
+            lo, hi = self._channelBounds(channels, start, self._head)
+            visible = (hi + offsets >= ymin) & (lo + offsets <= ymax)
+            self.minmax.update(self.sample_store, start, self._head, block_size, self.ref_channel)
+            idx, values = self.minmax.extrema(channels[visible])
+        if not visible.any() or idx.shape[1] == 0:
+            self.curve.clear()
+            return
+        channels = channels[visible]
+        offsets = offsets[visible, numpy.newaxis]
+        values = numpy.clip(values, a_min=ymin - offsets, a_max=ymax - offsets)
+        if self.rolling_view:
+            x = idx % self.buffer_size
+        else:
+            x = idx / self.fs
+        # Each channel's line stops at its last point, so it isn't joined to the next channel,
+        # and in rolling view it's also broken where it wraps around
+        connect = numpy.ones(idx.shape, dtype='bool')
+        if self.rolling_view:
+            connect[:, :-1] = numpy.diff(x, axis=1) >= 0
+        connect[:, -1] = False
+        m = idx.shape[1]
+        spans = [(channel, i*m, (i+1)*m) for i, channel in enumerate(channels)]
+        channel_offsets = numpy.zeros(len(self.avgs))
+        channel_offsets[channels] = offsets[:, 0]
+        self.curve.setOffsets(channel_offsets)
+        self.curve.setData(x.ravel().astype('float64'), values.ravel(), connect.ravel(), spans)
+
+    # Returns the lowest and highest value of each of the given channels over [start, stop), relative to the
+    # reference channel, from the extremes the sample store keeps as it's written. With a reference the range is
+    # only an upper bound, which is good enough to tell whether a channel is in view.
+    def _channelBounds(self, channels, start, stop):
+        mins, maxs = self.sample_store.extrema(start, stop)
+        if self.ref_channel != -1:
+            mins, maxs = mins - maxs[self.ref_channel], maxs - mins[self.ref_channel]
+        return mins[channels], maxs[channels]
 
     # Allow snapping to a specific signal by clicking on it.
-    def autoscaleToData(self, item):
-        # Determine which plots are visible
-        idx_offset = [i for i in self.plots if i.isVisible()].index(item)
-        idx = self.plots.index(item)
-        min_val = numpy.min(self.buffers[idx]) - self.offset_factor*idx_offset
-        max_val = numpy.max(self.buffers[idx]) - self.offset_factor*idx_offset
-        self.setYRange(min=min_val, max=max_val)
\ No newline at end of file
+    def autoscaleToData(self, item, ev, idx):
+        # Determine where the channel sits among the visible ones
+        idx_offset = self.active_channels.index(idx)
+        start = self._head - min(self._head, self.buffer_size)
+        if self.ref_channel == -1:
+            min_val, max_val = self._channelBounds([idx], start, self._head)
+        else:
+            # The bounds are loose with a reference, so we look at the samples of this one channel instead
+            data = self.sample_store.view(start, self._head)
+            buffer = data[idx] - data[self.ref_channel]
+            min_val, max_val = numpy.min(buffer), numpy.max(buffer)
+        offset = self.avgs[idx] + self.offset_factor*idx_offset
+        self.setYRange(min=float(min_val - offset), max=float(max_val - offset))
@@ -0,0 +1,135 @@
+## Streaming source of packets read from a BDF/EDF recording
+
+import os
+import threading
+import queue
+import numpy
+import pyedflib
+from packet_encoder import PacketEncoder
+
+# Layout of a recording: BDF/EDF files are made of fixed-length data records, so the record holding any point in time,
+# and the sample it starts at, follow directly from the header without reading anything else.
+class RecordIndex():
+    def __init__(self, reader):
+        self.fs = reader.getSampleFrequency(0)
+        self.samples_per_record = int(reader.getNSamples()[0] // max(reader.datarecords_in_file, 1))
+        self.records = reader.datarecords_in_file
+        self.samples = reader.getNSamples()[0]
+        self.duration = self.samples / self.fs
+
+    # Sequence number of the first sample of the record holding the given time, clamped to the recording
+    def recordStart(self, seconds):
+        record = int(seconds * self.fs) // max(self.samples_per_record, 1)
+        record = min(max(record, 0), max(self.records - 1, 0))
+        return record * self.samples_per_record
+
+# Indexes of the recordings we've opened, keyed by path, size and modification time so an edited file is indexed again
+_indices = {}
+
+def recordIndex(file_name, reader):
+    status = os.stat(file_name)
+    key = (os.path.abspath(file_name), status.st_size, status.st_mtime)
+    if key not in _indices:
+        _indices[key] = RecordIndex(reader)
+    return _indices[key]
+
+# ReplaySource reads a recording a chunk at a time and encodes each chunk into ActiView packets on the fly, so replaying
+# a recording only ever holds a few chunks in memory no matter how long it is. Chunks are read ahead of time by a
+# background thread into a bounded queue, which keeps the sender supplied without it ever waiting on the disk.
+# Samples are read as physical values and truncated to integers, as the device would send them.
+class ReplaySource():
+    def __init__(self, file_name, total_channels, samples, chunk_packets=64, prefetch=4):
+        self.total_channels = total_channels
+        self.samples = samples
+        self.chunk_samples = chunk_packets * samples
+        self.reader = pyedflib.EdfReader(file_name)
+        self.index = recordIndex(file_name, self.reader)
+        self.fs = self.index.fs
+        # Only whole packets are sent, so a trailing partial packet is left out
+        self.length = (self.index.samples // samples) * samples
+        # Channels the recording doesn't have are sent as zeros
+        self.file_channels = min(total_channels, self.reader.signals_in_file)
+        self._encoder = PacketEncoder(total_channels, self.chunk_samples)
+        self._block = numpy.zeros((total_channels, self.chunk_samples), dtype='int32')
+        self._chunks = queue.Queue(maxsize=max(prefetch, 1))
+        self._stop = threading.Event()
+        self._thread = None
+        # Seeking can come from another thread than the one reading, so starting and stopping are done one at a time
+        self._lock = threading.Lock()
+        # Number of seeks so far. Chunks are tagged with it, so none read before a seek get handed out after it.
+        self.seeks = 0
+
+    # Starts reading ahead from the sample position
+    def start(self, position=0):
+        with self._lock:
+            self._start(position)
+
+    def _start(self, position):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._readChunks, args=(position, self.seeks), daemon=True)
+        self._thread.start()
+
+    def _readChunks(self, position, seeks):
+        try:
+            while position < self.length and not self._stop.is_set():
+                n = min(self.chunk_samples, self.length - position)
+                block = self._block[:, :n]
+                for i in range(self.file_channels):
+                    block[i] = self.reader.readSignal(i, position, n)
+                chunk = bytes(self._encoder.encode(block))
+                if not self._put((seeks, position, chunk)):
+                    return
+                position += n
+        except Exception as err:
+            print("Failed to read recording:", err)
+        # Marks the end of the recording
+        self._put((seeks, None, None))
+
+    # Waits for room in the queue, giving up if we're asked to stop in the meantime
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # Returns the next (seeks, position, encoded chunk) of the recording, or None once it's over.
+    # Once seeks no longer matches our own count, the chunk has been superseded by a seek.
+    def read(self):
+        while True:
+            item = self._chunks.get()
+            if item[0] != self.seeks:
+                continue
+            if item[2] is None:
+                return None
+            return item
+
+    # Moves playback to the start of the record holding the given time, throwing away whatever was read ahead.
+    # Whoever is reading simply gets the chunks from the new position next.
+    def seek(self, seconds):
+        with self._lock:
+            self._stopReading()
+            self.seeks += 1
+            self._start(self.index.recordStart(seconds))
+
+    # Stops reading ahead and throws away whatever was already read
+    def stop(self):
+        with self._lock:
+            self._stopReading()
+
+    def _stopReading(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            while True:
+                self._chunks.get_nowait()
+        except queue.Empty:
+            pass
+
+    def close(self):
+        self.stop()
+        self.reader.close()
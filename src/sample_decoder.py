@@ -0,0 +1,82 @@
+## Decoders that turn raw ActiView packets into channel samples
+
+import numpy
+
+# ActiView sends each packet as 3-byte little-endian samples, interleaved so that the first sample of every channel
+# comes first, then the second sample of every channel, and so on.
+# A decoder takes a buffer holding any number of whole packets and returns a single (channels, packets*samples) block
+# with the gain already applied. All the intermediate arrays, as well as the output itself, are allocated once and
+# reused across calls, so the returned block is only valid until the next call to decode.
+class SampleDecoder():
+    def __init__(self, total_channels, samples, gain, dtype='float64', max_packets=8):
+        self.total_channels = total_channels
+        self.samples = samples
+        self.gain = gain
+        self.dtype = numpy.dtype(dtype)
+        self.packet_size = total_channels * samples * 3
+        self.max_packets = 0
+        self._allocate(max_packets)
+
+    # Grows the reusable buffers so they can hold the given amount of packets
+    def _allocate(self, packets):
+        self.max_packets = packets
+        self._out = numpy.empty(self.total_channels * self.samples * packets, dtype=self.dtype)
+
+    def decode(self, frames):
+        packets = len(frames) // self.packet_size
+        if packets > self.max_packets:
+            self._allocate(packets)
+        n = packets * self.samples
+        # Every row is one time step holding a 3-byte integer per channel
+        raw = numpy.frombuffer(frames, dtype='uint8', count=n * self.total_channels * 3).reshape(n, self.total_channels, 3)
+        out = self._out[:self.total_channels * n].reshape(self.total_channels, n)
+        self._decodeInto(raw, out)
+        return out
+
+    def _decodeInto(self, raw, out):
+        raise NotImplementedError
+
+# Copies the three bytes into the upper part of a zeroed 4-byte array and reads it back as int32, which sign extends
+# for free. The resulting values are scaled by 2**8, which the gain already accounts for.
+class PaddedDecoder(SampleDecoder):
+    def _allocate(self, packets):
+        super()._allocate(packets)
+        self._padded = numpy.zeros((packets * self.samples, self.total_channels, 4), dtype='uint8')
+
+    def _decodeInto(self, raw, out):
+        n = raw.shape[0]
+        padded = self._padded[:n]
+        padded[:, :, 1:] = raw
+        values = padded.view('<i4').reshape(n, self.total_channels)
+        # Transposing here de-interleaves the channels while we apply the gain, all in one pass
+        numpy.multiply(values.T, self.gain, out=out)
+
+# Assembles the integers with shifts instead, sign extending by hand. Both decoders give the same results on any
+# platform, as PaddedDecoder reads its bytes explicitly as little-endian; this one just trades PaddedDecoder's extra copy
+# for a bit more arithmetic, so which is faster depends on the machine.
+class ShiftDecoder(SampleDecoder):
+    def _allocate(self, packets):
+        super()._allocate(packets)
+        shape = (packets * self.samples, self.total_channels)
+        self._values = numpy.empty(shape, dtype='int32')
+        self._scratch = numpy.empty(shape, dtype='int32')
+
+    def _decodeInto(self, raw, out):
+        n = raw.shape[0]
+        values = self._values[:n]
+        scratch = self._scratch[:n]
+        numpy.left_shift(raw[:, :, 2], 16, out=values, dtype='int32')
+        numpy.left_shift(raw[:, :, 1], 8, out=scratch, dtype='int32')
+        numpy.bitwise_or(values, scratch, out=values)
+        numpy.bitwise_or(values, raw[:, :, 0], out=values)
+        # Sign extend the 24-bit values
+        numpy.bitwise_xor(values, 0x800000, out=values)
+        numpy.subtract(values, 0x800000, out=values)
+        # Our gain expects values scaled by 2**8, as produced by PaddedDecoder
+        numpy.multiply(values.T, self.gain * 2**8, out=out)
+
+# Decoders that can be selected through the settings
+DECODERS = {
+    "padded": PaddedDecoder,
+    "shift": ShiftDecoder,
+}
@@ -0,0 +1,92 @@
+## Shared storage for the incoming samples
+
+import numpy
+
+# SampleStore is a (channels x capacity) ring buffer shared by every consumer of the incoming data.
+# The ingest thread writes each block once, and consumers read from it directly instead of keeping their own copies.
+#
+# Samples are addressed by their sequence number, i.e. their index counted from the start of the capture, and
+# head is the sequence number of the next sample to be written. The ring is stored twice back to back
+# (a mirrored buffer), which costs a second write per block but means that any range of up to capacity samples
+# is contiguous in memory, so reads are always plain numpy views with no unwrapping or copying.
+#
+# There is no locking: a view stays valid as long as the writer hasn't lapped it, so consumers should read well within
+# the capacity and can use isValid to check whether their data was overwritten in the meantime.
+#
+# Each write also updates the minimum and maximum of every channel over chunks of chunk_size samples,
+# so consumers can find the range of a channel over any span without scanning its samples.
+class SampleStore():
+    def __init__(self, total_channels, capacity, dtype='float64', chunk_size=64):
+        self.total_channels = total_channels
+        self.capacity = capacity
+        self.dtype = numpy.dtype(dtype)
+        self._arr = numpy.zeros((total_channels, 2*capacity), dtype=self.dtype)
+        self.head = 0
+        self.chunk_size = chunk_size
+        # Enough chunks that the one holding the oldest sample is never overwritten
+        self._chunks = capacity // chunk_size + 2
+        self._chunk_min = numpy.zeros((total_channels, self._chunks), dtype=self.dtype)
+        self._chunk_max = numpy.zeros((total_channels, self._chunks), dtype=self.dtype)
+
+    # Sequence number of the oldest sample still held
+    def oldest(self):
+        return max(0, self.head - self.capacity)
+
+    def isValid(self, start):
+        return start >= self.head - self.capacity
+
+    def write(self, block):
+        n = block.shape[1]
+        # Anything older than our capacity would be overwritten straight away, so we skip it
+        if n > self.capacity:
+            block = block[:, -self.capacity:]
+            self.head += n - self.capacity
+            n = self.capacity
+        self._writeExtrema(block, self.head)
+        pos = self.head % self.capacity
+        first = min(n, self.capacity - pos)
+        self._arr[:, pos:pos+first] = block[:, :first]
+        self._arr[:, pos+self.capacity:pos+self.capacity+first] = block[:, :first]
+        rest = n - first
+        if rest > 0:
+            self._arr[:, :rest] = block[:, first:]
+            self._arr[:, self.capacity:self.capacity+rest] = block[:, first:]
+        self.head += n
+
+    def _writeExtrema(self, block, start):
+        n = block.shape[1]
+        if n == 0:
+            return
+        c = self.chunk_size
+        first = start // c
+        last = -(-(start + n) // c)
+        # Offsets within the block where each chunk it touches begins
+        bounds = numpy.maximum(numpy.arange(first, last) * c - start, 0)
+        mins = numpy.minimum.reduceat(block, bounds, axis=1)
+        maxs = numpy.maximum.reduceat(block, bounds, axis=1)
+        slots = numpy.arange(first, last) % self._chunks
+        # A chunk we started in a previous write keeps the extremes of its earlier samples
+        if start % c != 0:
+            numpy.minimum(mins[:, 0], self._chunk_min[:, slots[0]], out=mins[:, 0])
+            numpy.maximum(maxs[:, 0], self._chunk_max[:, slots[0]], out=maxs[:, 0])
+        self._chunk_min[:, slots] = mins
+        self._chunk_max[:, slots] = maxs
+
+    # Returns the minimum and maximum of every channel over [start, stop) as two arrays of shape (channels,).
+    # They are computed over whole chunks, so they may include a few samples on either side of the range.
+    def extrema(self, start, stop):
+        start = max(start, self.oldest())
+        stop = min(stop, self.head)
+        if stop <= start:
+            return numpy.zeros(self.total_channels, dtype=self.dtype), numpy.zeros(self.total_channels, dtype=self.dtype)
+        slots = numpy.arange(start // self.chunk_size, -(-stop // self.chunk_size)) % self._chunks
+        return numpy.min(self._chunk_min[:, slots], axis=1), numpy.max(self._chunk_max[:, slots], axis=1)
+
+    # Returns a (channels x (stop - start)) view of the samples in [start, stop).
+    # Sequence numbers before the start of the capture are allowed and read as zeros.
+    def view(self, start, stop):
+        length = stop - start
+        if length > self.capacity or start < self.head - self.capacity or stop > self.head:
+            raise IndexError("Range [%d, %d) is not held in the store (head %d)" % (start, stop, self.head))
+        pos = start % self.capacity
+        return self._arr[:, pos:pos+length]
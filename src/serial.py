@@ -1,4 +1,6 @@
 from PyQt6 import QtCore, QtSerialPort
+from time import perf_counter
+import stats
 
 # Class that handles setting up underlying serial communication, as well as writing and sending data
 class SerialHandler(QtCore.QObject):
@@ -28,9 +30,11 @@ class SerialHandler(QtCore.QObject):
     def write(self, data):
         if not self.is_open or not self.write_enabled:
             return
-        print("Writing", data)
+        start = perf_counter()
         if self.serial.write(data) == -1:
             print("Failed to write!", self.serial.errorString())
+        stats.pipeline.record("serial_write", perf_counter() - start)
+        stats.pipeline.count("serial_writes")
 
     def setWriteEnabled(self, enable):
         if(enable == QtCore.Qt.CheckState.Checked):
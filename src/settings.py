@@ -1,6 +1,7 @@
 ## Load settings from JSON file
 
 import json
+import global_vars
 from PyQt6.QtCore import Qt
 # SettingsHandler serves as the interface through which other modules
 # can update the global settings variable, which serves as an unique source 
@@ -31,14 +32,40 @@ class SettingsHandler():
         self.settings['biosemi'].setdefault("channels", {'A': 32, 'B': 32, 'EX': 8}) # (Set, Amount)
         self.settings['biosemi'].setdefault("ex_enabled", False)
         self.settings['biosemi'].setdefault("samples", 64)
+        self.settings.setdefault("pipeline", {})
+        self.settings['pipeline'].setdefault("decoder", "padded")
+        self.settings['pipeline'].setdefault("max_latency", 10) # Milliseconds
+        self.settings['pipeline'].setdefault("max_block", 512) # Samples
+        self.settings['pipeline'].setdefault("precision", "float32") # Sample dtype, float32 or float64
         self.settings.setdefault("filter", {})
         self.settings['filter'].setdefault("decimating_factor", 1)
         self.settings['filter'].setdefault("lowpass_taps", 101)
+        self.settings['filter'].setdefault("order", 4)
+        self.settings['filter'].setdefault("notch_enabled", False)
+        self.settings['filter'].setdefault("notch_freq", 50)
+        self.settings['filter'].setdefault("notch_quality", 30)
+        self.settings['filter'].setdefault("highpass_enabled", False)
+        self.settings['filter'].setdefault("highpass_cutoff", 0.5)
+        self.settings['filter'].setdefault("bandpass_enabled", False)
+        self.settings['filter'].setdefault("bandpass_low", 1)
+        self.settings['filter'].setdefault("bandpass_high", 40)
         self.settings.setdefault("view", {})
         self.settings['view'].setdefault('rolling_enabled', True)
+        self.settings['view'].setdefault('time_length', 8) # Seconds of data shown in the time-domain plot
+        self.settings['view'].setdefault('history_length', 1800) # Seconds of history kept for zooming out
+        self.settings['view'].setdefault('target_fps', 30) # Redraws per second of the time-domain plot
         self.settings.setdefault("fft", {})
         self.settings['fft'].setdefault("welch_enabled", True)
         self.settings['fft'].setdefault("welch_window", 2048*4)
+        self.settings['fft'].setdefault("per_channel", False)
+        self.settings['fft'].setdefault("refresh_rate", 15) # Maximum PSD refresh rate in Hz
+        # Frequency bands as {name: [lower, upper]} in Hz, both inclusive. The alpha threshold expects an "Alpha" band.
+        self.settings['fft'].setdefault("bands", {band: list(limits) for band, limits in global_vars.FREQ_BANDS.items()})
+        self.settings.setdefault("stats", {})
+        self.settings['stats'].setdefault("dump_enabled", False)
+        self.settings['stats'].setdefault("dump_interval", 10) # Seconds
+        self.settings['stats'].setdefault("dump_file", "pipeline_stats.jsonl")
+        self.settings['stats'].setdefault("dump_format", "json") # json (one object per line) or csv
         self.settings.setdefault("threshold", {})
         self.settings['threshold'].setdefault("alpha", 0.5)
         self.settings.setdefault("serial", {})
@@ -48,6 +75,9 @@ class SettingsHandler():
         self.settings.setdefault("file", {})
         self.settings['file'].setdefault('current_file', None)
         self.settings['file'].setdefault('directory', None)
+        self.settings.setdefault("debug", {})
+        self.settings['debug'].setdefault('speed', 1.0) # Multiple of real time the debug sources send at, 0 for unthrottled
+        self.settings['debug'].setdefault('profile', "sine") # Synthetic signal sent by the debug source, see signal_generator.PROFILES
 
     def saveSettings(self):
         try:
@@ -82,12 +112,55 @@ class SettingsHandler():
     def setSamples(self, samples):
         self.settings['biosemi']['samples'] = int(samples)
 
+    def setDecoder(self, decoder):
+        self.settings['pipeline']['decoder'] = str(decoder)
+
+    def setMaxLatency(self, latency):
+        self.settings['pipeline']['max_latency'] = float(latency)
+
+    def setMaxBlock(self, samples):
+        self.settings['pipeline']['max_block'] = int(samples)
+
+    def setPrecision(self, precision):
+        if precision in ("float32", "float64"):
+            self.settings['pipeline']['precision'] = precision
+
     def setDecimatingFactor(self, factor):
         self.settings['filter']['decimating_factor'] = int(factor)
 
     def setLowpassTaps(self, taps):
         self.settings['filter']['lowpass_taps'] = int(taps)
 
+    def setNotchEnabled(self, enable):
+        if(enable == Qt.CheckState.Checked):
+            self.settings['filter']['notch_enabled'] = True
+        else:
+            self.settings['filter']['notch_enabled'] = False
+
+    def setNotchFreq(self, freq):
+        self.settings['filter']['notch_freq'] = float(freq)
+
+    def setHighpassEnabled(self, enable):
+        if(enable == Qt.CheckState.Checked):
+            self.settings['filter']['highpass_enabled'] = True
+        else:
+            self.settings['filter']['highpass_enabled'] = False
+
+    def setHighpassCutoff(self, cutoff):
+        self.settings['filter']['highpass_cutoff'] = float(cutoff)
+
+    def setBandpassEnabled(self, enable):
+        if(enable == Qt.CheckState.Checked):
+            self.settings['filter']['bandpass_enabled'] = True
+        else:
+            self.settings['filter']['bandpass_enabled'] = False
+
+    def setBandpassLow(self, freq):
+        self.settings['filter']['bandpass_low'] = float(freq)
+
+    def setBandpassHigh(self, freq):
+        self.settings['filter']['bandpass_high'] = float(freq)
+
     def setWelchEnabled(self, enable):
         if(enable == Qt.CheckState.Checked):
             self.settings['fft']['welch_enabled'] = True
@@ -97,6 +170,15 @@ class SettingsHandler():
     def setWelchWindow(self, window):
         self.settings['fft']['welch_window'] = int(window)
 
+    def setRefreshRate(self, rate):
+        self.settings['fft']['refresh_rate'] = float(rate)
+
+    def setPerChannelEnabled(self, enable):
+        if(enable == Qt.CheckState.Checked):
+            self.settings['fft']['per_channel'] = True
+        else:
+            self.settings['fft']['per_channel'] = False
+
     def setExEnabled(self, enable):
         if(enable == Qt.CheckState.Checked):
             self.settings['biosemi']['ex_enabled'] = True
@@ -126,8 +208,29 @@ class SettingsHandler():
     def setDirectory(self, directory):
         self.settings['file']['directory'] = str(directory)
 
+    def setReplaySpeed(self, speed):
+        self.settings['debug']['speed'] = float(speed)
+
     def setRollingEnabled(self, enable):
         if(enable == Qt.CheckState.Checked):
             self.settings['view']['rolling_enabled'] = True
         else:
-            self.settings['view']['rolling_enabled'] = False
\ No newline at end of file
+            self.settings['view']['rolling_enabled'] = False
+
+    def setTimeLength(self, length):
+        self.settings['view']['time_length'] = float(length)
+
+    def setHistoryLength(self, length):
+        self.settings['view']['history_length'] = int(length)
+
+    def setTargetFps(self, fps):
+        self.settings['view']['target_fps'] = int(fps)
+
+    def setStatsDumpEnabled(self, enable):
+        if(enable == Qt.CheckState.Checked):
+            self.settings['stats']['dump_enabled'] = True
+        else:
+            self.settings['stats']['dump_enabled'] = False
+
+    def setStatsDumpInterval(self, interval):
+        self.settings['stats']['dump_interval'] = float(interval)
@@ -0,0 +1,156 @@
+## Synthetic signals for the debug source
+
+import numpy
+from scipy import signal
+
+# Largest values a 3-byte sample can hold
+SAMPLE_MAX = 2**23 - 1
+SAMPLE_MIN = -2**23
+
+# Pink (1/f) noise for every channel, made by filtering white noise with a filter whose response falls off at 3 dB
+# per octave. The filter state is carried over between blocks, so consecutive blocks join up into one stream.
+class PinkNoise():
+    B = [0.049922035, -0.095993537, 0.050612699, -0.004408786]
+    A = [1, -2.494956002, 2.017265875, -0.522189400]
+
+    def __init__(self, total_channels, rng, scale):
+        self.rng = rng
+        self.scale = scale
+        self.total_channels = total_channels
+        self._zi = numpy.zeros((total_channels, len(self.A) - 1))
+
+    def generate(self, n):
+        white = self.rng.standard_normal((self.total_channels, n))
+        pink, self._zi = signal.lfilter(self.B, self.A, white, axis=-1, zi=self._zi)
+        return pink * self.scale
+
+# A SignalGenerator produces whole (channels, samples) blocks of integer samples, in the units of the device,
+# ready for PacketEncoder. Each profile only has to work out the values for a block of sample times, as every
+# channel is computed at once. The time keeps running from one block to the next, and the values are clipped to
+# what a 3-byte sample can hold and truncated to integers, as the device would send them.
+class SignalGenerator():
+    def __init__(self, total_channels, fs, seed=None):
+        self.total_channels = total_channels
+        self.fs = fs
+        self.rng = numpy.random.default_rng(seed)
+        self._sample = 0
+        self._block = numpy.empty((total_channels, 0), dtype='int32')
+
+    def generate(self, n):
+        t = (self._sample + numpy.arange(n)) / self.fs
+        self._sample += n
+        values = self._values(t)
+        if self._block.shape[1] < n:
+            self._block = numpy.empty((self.total_channels, n), dtype='int32')
+        block = self._block[:, :n]
+        numpy.clip(values, SAMPLE_MIN, SAMPLE_MAX, out=values)
+        numpy.copyto(block, values, casting='unsafe')
+        return block
+
+    # Returns the (channels, len(t)) float values of the signal at times t, in seconds
+    def _values(self, t):
+        raise NotImplementedError
+
+    # Every channel, as a column to broadcast against times
+    def _channels(self):
+        return numpy.arange(self.total_channels)[:, numpy.newaxis]
+
+# The original debug signal: a 10 Hz sine on every channel, large for the first 10 seconds and small for the next 10
+class SineGenerator(SignalGenerator):
+    def _values(self, t):
+        amplitude = numpy.where(t % 20 < 10, 1000, 10)
+        return numpy.tile(numpy.sin(2*numpy.pi*10*t) * amplitude, (self.total_channels, 1))
+
+# A handful of tones spread over the EEG bands, each channel with its own phases
+class MultitoneGenerator(SignalGenerator):
+    TONES = [(2, 800), (6, 600), (10, 1000), (21, 400), (40, 200)] # (Hz, amplitude)
+
+    def __init__(self, total_channels, fs, seed=None):
+        super().__init__(total_channels, fs, seed)
+        self._phases = self.rng.uniform(0, 2*numpy.pi, (len(self.TONES), total_channels, 1))
+
+    def _values(self, t):
+        values = numpy.zeros((self.total_channels, len(t)))
+        for (freq, amplitude), phase in zip(self.TONES, self._phases):
+            values += amplitude * numpy.sin(2*numpy.pi*freq*t + phase)
+        return values
+
+# Background EEG-like noise, which the profiles below add their features on top of
+class PinkNoiseGenerator(SignalGenerator):
+    NOISE_SCALE = 6000
+
+    def __init__(self, total_channels, fs, seed=None):
+        super().__init__(total_channels, fs, seed)
+        self._noise = PinkNoise(total_channels, self.rng, self.NOISE_SCALE)
+
+    def _values(self, t):
+        return self._noise.generate(len(t))
+
+# 10 Hz bursts of BURST seconds every PERIOD seconds, for exercising the alpha threshold
+class AlphaBurstGenerator(PinkNoiseGenerator):
+    PERIOD = 6
+    BURST = 2
+    AMPLITUDE = 1500
+
+    def _values(self, t):
+        # Smooth the edges of every burst with half a second of raised cosine
+        phase = t % self.PERIOD
+        envelope = numpy.clip(numpy.minimum(phase, self.BURST - phase) * 4, 0, 1)
+        envelope = 0.5 - 0.5*numpy.cos(numpy.pi*envelope)
+        return super()._values(t) + self.AMPLITUDE * envelope * numpy.sin(2*numpy.pi*10*t)
+
+# Interference from the mains, with its odd harmonics, stronger on some channels than others
+class MainsGenerator(PinkNoiseGenerator):
+    FREQ = 50
+    AMPLITUDE = 3000
+
+    def _values(self, t):
+        mains = numpy.sin(2*numpy.pi*self.FREQ*t) + 0.3*numpy.sin(2*numpy.pi*3*self.FREQ*t) + 0.1*numpy.sin(2*numpy.pi*5*self.FREQ*t)
+        coupling = 1 + (self._channels() % 4)
+        return super()._values(t) + self.AMPLITUDE * coupling * mains
+
+# Every fourth channel is flat, like an electrode that has come off
+class FlatlineGenerator(PinkNoiseGenerator):
+    def _values(self, t):
+        values = super()._values(t)
+        values[::4] = 0
+        return values
+
+# Every fourth channel is stuck at the top of the range, like an amplifier driven into saturation
+class SaturatedGenerator(PinkNoiseGenerator):
+    def _values(self, t):
+        values = super()._values(t)
+        values[::4] = SAMPLE_MAX
+        return values
+
+# The offset of every channel jumps to a new random level every PERIOD seconds, like electrode movement artifacts
+class StepGenerator(PinkNoiseGenerator):
+    PERIOD = 3
+    STEP_SCALE = 50000
+
+    def __init__(self, total_channels, fs, seed=None):
+        super().__init__(total_channels, fs, seed)
+        self._step = None
+        self._offset = None
+
+    def _values(self, t):
+        steps = (t // self.PERIOD).astype('int64')
+        offsets = numpy.empty((self.total_channels, len(t)))
+        for step in numpy.unique(steps):
+            if step != self._step:
+                self._step = step
+                self._offset = self.rng.normal(scale=self.STEP_SCALE, size=(self.total_channels, 1))
+            offsets[:, steps == step] = self._offset
+        return super()._values(t) + offsets
+
+# Profiles that can be selected through the settings
+PROFILES = {
+    "sine": SineGenerator,
+    "multitone": MultitoneGenerator,
+    "pink": PinkNoiseGenerator,
+    "alpha": AlphaBurstGenerator,
+    "mains": MainsGenerator,
+    "flatline": FlatlineGenerator,
+    "saturated": SaturatedGenerator,
+    "step": StepGenerator,
+}
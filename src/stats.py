@@ -0,0 +1,141 @@
+## Instrumentation of the data pipeline
+
+# Every stage of the pipeline records how long it took into a latency histogram, and bumps a few counters, so that
+# we can see where the time goes while a capture runs. There is a single set of statistics shared by every thread,
+# the pipeline object at the bottom of this file. Each stage is only ever recorded from one thread, and a snapshot
+# that reads a value a moment too early doesn't matter to us, so none of this takes any locks.
+import os
+import csv
+import json
+from collections import deque
+from time import perf_counter, time
+
+# Histogram of durations with logarithmic buckets: bucket i counts durations below 2**i microseconds
+# (and at least half that), which covers everything from a microsecond to over half a minute in 26 buckets.
+class LatencyHistogram():
+    BUCKETS = 26
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        bucket = min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Upper bound in seconds of the bucket holding the given percentile
+    def percentile(self, percent):
+        if self.count == 0:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(2**bucket / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": mean * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+# Measures how long notifications wait in a Qt event queue before their slot runs, and how many are waiting.
+# The sending thread calls sent() right before emitting, and the slot calls received() as soon as it runs.
+class QueueProbe():
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._sent = deque(maxlen=4096)
+        self.max_depth = 0
+
+    def sent(self):
+        self._sent.append(perf_counter())
+        if len(self._sent) > self.max_depth:
+            self.max_depth = len(self._sent)
+
+    def received(self):
+        try:
+            sent_at = self._sent.popleft()
+        except IndexError:
+            return
+        self.histogram.record(perf_counter() - sent_at)
+
+    def depth(self):
+        return len(self._sent)
+
+# The statistics of a whole capture. Stage durations are recorded with record(stage, seconds), and events with
+# count(name). Every snapshot also works out the byte and packet rates since the previous one.
+class PipelineStats():
+    STAGES = ("recv", "decode", "filter", "decimate", "ring_write", "emit_wait", "fft", "plot_frame", "serial_write", "threshold_to_serial")
+    COUNTERS = ("bytes", "packets", "short_reads", "empty_reads", "store_laps", "fft_requests", "fft_runs",
+                "plot_overruns", "serial_writes")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.emit_queue = QueueProbe(self.histograms["emit_wait"])
+        self._last_time = perf_counter()
+        self._last_counters = dict(self.counters)
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    # Returns every statistic in a single flat dictionary, which is what both the stats dock and the dumps use
+    def snapshot(self):
+        now = perf_counter()
+        elapsed = max(now - self._last_time, 1e-9)
+        counters = dict(self.counters)
+        snapshot = {"time": time()}
+        snapshot.update(counters)
+        snapshot["bytes_per_s"] = (counters["bytes"] - self._last_counters["bytes"]) / elapsed
+        snapshot["packets_per_s"] = (counters["packets"] - self._last_counters["packets"]) / elapsed
+        # Superseded requests are the ones the scheduler dropped in favor of a newer one
+        snapshot["fft_dropped"] = max(counters["fft_requests"] - counters["fft_runs"], 0)
+        snapshot["emit_queue_depth"] = self.emit_queue.depth()
+        snapshot["emit_queue_max_depth"] = self.emit_queue.max_depth
+        for stage, histogram in self.histograms.items():
+            for key, value in histogram.summary().items():
+                snapshot[stage + "_" + key] = value
+        self._last_time = now
+        self._last_counters = counters
+        return snapshot
+
+# Appends snapshots to a file, either as one JSON object per line or as CSV rows under a header
+class StatsDumper():
+    def __init__(self, file_name, file_format="json"):
+        self.file_name = file_name
+        self.file_format = file_format
+
+    def dump(self, snapshot):
+        try:
+            if self.file_format == "csv":
+                new_file = not os.path.exists(self.file_name) or os.path.getsize(self.file_name) == 0
+                with open(self.file_name, 'a', newline='') as file:
+                    writer = csv.DictWriter(file, fieldnames=list(snapshot.keys()))
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerow(snapshot)
+            else:
+                with open(self.file_name, 'a') as file:
+                    file.write(json.dumps(snapshot) + "\n")
+        except Exception as err:
+            print("Failed to dump statistics:", err)
+
+pipeline = PipelineStats()
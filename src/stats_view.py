@@ -0,0 +1,51 @@
+from PyQt6 import QtWidgets
+import stats
+
+# Shows the latest snapshot of the pipeline statistics: a row per stage with its latencies, followed by the counters,
+# along with the controls for periodically dumping them to a file
+class StatsView(QtWidgets.QWidget):
+    COLUMNS = ["count", "mean_ms", "p50_ms", "p99_ms", "max_ms"]
+
+    def __init__(self, settings):
+        super().__init__()
+        layout = QtWidgets.QVBoxLayout()
+        self.setLayout(layout)
+
+        dump_widget = QtWidgets.QWidget()
+        dump_layout = QtWidgets.QHBoxLayout()
+        dump_layout.setContentsMargins(0, 0, 0, 0)
+        self.dump_checkbox = QtWidgets.QCheckBox("Dump to " + settings['stats']['dump_file'] + " every [s]")
+        self.dump_checkbox.setChecked(settings['stats']['dump_enabled'])
+        self.dump_interval_box = QtWidgets.QDoubleSpinBox()
+        self.dump_interval_box.setRange(1, 3600)
+        self.dump_interval_box.setValue(settings['stats']['dump_interval'])
+        dump_layout.addWidget(self.dump_checkbox)
+        dump_layout.addWidget(self.dump_interval_box)
+        dump_widget.setLayout(dump_layout)
+        layout.addWidget(dump_widget)
+
+        self.stage_table = QtWidgets.QTableWidget(len(stats.PipelineStats.STAGES), len(self.COLUMNS))
+        self.stage_table.setHorizontalHeaderLabels(["Count", "Mean [ms]", "p50 [ms]", "p99 [ms]", "Max [ms]"])
+        self.stage_table.setVerticalHeaderLabels(list(stats.PipelineStats.STAGES))
+        self.stage_table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.stage_table)
+
+        self.counter_label = QtWidgets.QLabel()
+        self.counter_label.setWordWrap(True)
+        layout.addWidget(self.counter_label)
+
+    def showSnapshot(self, snapshot):
+        for row, stage in enumerate(stats.PipelineStats.STAGES):
+            for column, key in enumerate(self.COLUMNS):
+                value = snapshot[stage + "_" + key]
+                text = str(value) if key == "count" else "%.3f" % value
+                item = self.stage_table.item(row, column)
+                if item is None:
+                    self.stage_table.setItem(row, column, QtWidgets.QTableWidgetItem(text))
+                else:
+                    item.setText(text)
+        counters = ["%.1f kB/s" % (snapshot["bytes_per_s"] / 1000), "%.1f packets/s" % snapshot["packets_per_s"],
+                    "plot queue: %d (max %d)" % (snapshot["emit_queue_depth"], snapshot["emit_queue_max_depth"])]
+        counters += ["%s: %d" % (name, snapshot[name]) for name in stats.PipelineStats.COUNTERS]
+        counters.append("fft_dropped: %d" % snapshot["fft_dropped"])
+        self.counter_label.setText(", ".join(counters))
@@ -1,10 +1,10 @@
-from pyqtgraph import AxisItem, PlotItem, ButtonItem
+from pyqtgraph import AxisItem, PlotItem, ButtonItem, GraphicsObject
 import pyqtgraph.exporters
+import pyqtgraph.functions as fn
 
-from PyQt6 import QtWidgets, QtGui
+from PyQt6 import QtWidgets, QtGui, QtCore
 import numpy as np
 import math
-from dvg_ringbuffer import RingBuffer
 
 # Class that inherits from AxisItem to provide better tick display for logarithmic axes.
 # TODO: Add detection for text overlapping, not clear if I can use boundingRect for this
@@ -124,22 +124,107 @@ class CustomPlotItem(PlotItem):
         except RuntimeError:
             pass  # this can happen if the plot has been deleted.
 
-# Ring buffer that wraps around to the beginning when full
-class RollingRingBuffer(RingBuffer):
-    def _unwrap_into_buffer(self):
-        """Copy the data from this buffer into unwrapped form to the unwrap
-        buffer at a fixed memory address. Only call when the buffer is full.
-        """
-        if self._unwrap_buffer_is_dirty:
-            # print("Unwrap buffer was dirty")
-            np.concatenate(
-                (
-                    self._arr[: max(self._idx_R - self._N, 0)],
-                    self._arr[self._idx_L : min(self._idx_R, self._N)],
-                ),
-                out=self._unwrap_buffer,
-            )
-            self._unwrap_buffer_is_dirty = False
-        else:
-            # print("Unwrap buffer was clean")
-            pass
\ No newline at end of file
+# Curve item that draws many channels at once, replacing one PlotCurveItem per channel.
+# All channels are passed in as one concatenated vertex array, along with a connect mask that breaks the line
+# between channels (and anywhere else a channel shouldn't be joined up), and the span each channel occupies in it.
+# Each channel is drawn with its own pen and vertical offset, but the scene only has to track and update a single item.
+class MultiCurveItem(GraphicsObject):
+    sigClicked = QtCore.pyqtSignal(object, object, int)
+
+    def __init__(self, pens, mouse_width=8):
+        super().__init__()
+        self.pens = pens
+        self.mouse_width = mouse_width
+        self.x = None
+        self.y = None
+        self.connect = None
+        self.spans = []
+        self.offsets = np.zeros(len(pens))
+        self._paths = None
+        self._bounding_rect = None
+
+    # x, y and connect are the concatenated arrays for every channel drawn, and spans holds a
+    # (channel, start, stop) tuple per channel telling us which slice of the arrays belongs to it.
+    def setData(self, x, y, connect, spans):
+        self.prepareGeometryChange()
+        self.x = x
+        self.y = y
+        self.connect = connect
+        self.spans = spans
+        self._paths = None
+        self._bounding_rect = None
+        self.update()
+
+    # Sets the vertical offset every channel is drawn at, indexed by channel. Stacking the channels this way
+    # only changes how the paths are drawn, so neither the data nor the paths need to be rebuilt.
+    def setOffsets(self, offsets):
+        if np.array_equal(offsets, self.offsets):
+            return
+        self.prepareGeometryChange()
+        self.offsets = np.array(offsets, dtype='float64')
+        self._bounding_rect = None
+        self.update()
+
+    def clear(self):
+        self.setData(None, None, None, [])
+
+    # Every unbroken run of vertices goes in as its own polygon, which is the fast path for arrayToQPath
+    # (and unlike connect arrays, it's safe with the experimental option enabled).
+    def _buildPaths(self):
+        self._paths = []
+        for channel, start, stop in self.spans:
+            breaks = np.flatnonzero(~self.connect[start:stop - 1]) + start + 1
+            path = QtGui.QPainterPath()
+            for (run_start, run_stop) in zip([start, *breaks], [*breaks, stop]):
+                path.addPath(fn.arrayToQPath(self.x[run_start:run_stop], self.y[run_start:run_stop], connect='all'))
+            self._paths.append((channel, path))
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        if self.x is None or len(self.x) == 0:
+            return (None, None)
+        if ax == 0:
+            return (float(np.min(self.x)), float(np.max(self.x)))
+        lows = [np.min(self.y[start:stop]) + self.offsets[channel] for (channel, start, stop) in self.spans]
+        highs = [np.max(self.y[start:stop]) + self.offsets[channel] for (channel, start, stop) in self.spans]
+        return (float(min(lows)), float(max(highs)))
+
+    def boundingRect(self):
+        if self._bounding_rect is None:
+            (xmn, xmx) = self.dataBounds(ax=0)
+            if xmn is None:
+                return QtCore.QRectF()
+            (ymn, ymx) = self.dataBounds(ax=1)
+            self._bounding_rect = QtCore.QRectF(xmn, ymn, xmx-xmn, ymx-ymn)
+        return self._bounding_rect
+
+    def paint(self, p, *args):
+        if self.x is None or len(self.x) == 0:
+            return
+        if self._paths is None:
+            self._buildPaths()
+        p.setRenderHint(p.RenderHint.Antialiasing, False)
+        for channel, path in self._paths:
+            p.setPen(self.pens[channel])
+            p.translate(0, self.offsets[channel])
+            p.drawPath(path)
+            p.translate(0, -self.offsets[channel])
+
+    # Clicking close enough to a channel's line emits sigClicked with that channel
+    def mouseClickEvent(self, ev):
+        if ev.button() != QtCore.Qt.MouseButton.LeftButton or not self.spans:
+            return
+        view = self.getViewBox()
+        if view is None:
+            return
+        if self._paths is None:
+            self._buildPaths()
+        stroker = QtGui.QPainterPathStroker()
+        stroker.setWidth(self.mouse_width)
+        for channel, path in self._paths:
+            path = QtGui.QTransform.fromTranslate(0, self.offsets[channel]).map(path)
+            # Stroke in view coordinates, so our click width is measured in pixels rather than data units
+            shape = self.mapFromItem(view, stroker.createStroke(self.mapToItem(view, path)))
+            if shape.contains(ev.pos()):
+                ev.accept()
+                self.sigClicked.emit(self, ev, channel)
+                return
@@ -0,0 +1,90 @@
+## Incremental Welch PSD estimation over the sample store
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal, fft
+import pyfftw
+
+# Welch's method averages the periodograms of overlapping segments, and between two updates only a handful of
+# new segments are completed. IncrementalWelch keeps the periodograms of the most recent segments in a ring along with
+# their running sum, and on each update only computes the segments that were completed since the last one.
+#
+# Segments are aligned to the sample sequence numbers of the store rather than to the start of the window,
+# so the result matches signal.welch (hann window, 50% overlap, constant detrend, density scaling) over the
+# window_length samples ending at the last completed segment.
+#
+# Every update works on a (rows x samples) signal, one row per spectrum we want, so a whole PSD matrix
+# is computed with one FFTW plan built ahead of time and reused for every segment.
+# The transforms run in the precision of the samples (dtype), while the running sum is always kept in double precision.
+class IncrementalWelch():
+    def __init__(self, fs, nperseg, window_length, rows=1, dtype='float64'):
+        self.fs = fs
+        self.nperseg = nperseg
+        self.rows = rows
+        self.step = nperseg - nperseg//2
+        self.n_segments = max((window_length - nperseg) // self.step + 1, 1)
+        window = signal.get_window('hann', nperseg)
+        self.scale = 1.0 / (fs * numpy.sum(window**2))
+        self.window = window.astype(dtype)
+        self.freqs = fft.rfftfreq(nperseg, 1/fs)
+        self._periodograms = numpy.zeros((self.n_segments, rows, len(self.freqs)), dtype=dtype)
+        self._sum = numpy.zeros((rows, len(self.freqs)))
+        # The plan works in place on our aligned input array, so executing it allocates nothing.
+        # Measuring takes a while for new sizes, which is why we build it here rather than on the first update,
+        # and it's nearly instant when FFTW already has wisdom for this size.
+        self._fft_in = pyfftw.empty_aligned((rows, nperseg), dtype=dtype)
+        self._fft = pyfftw.builders.rfft(self._fft_in, axis=-1, avoid_copy=True, planner_effort='FFTW_MEASURE')
+        self.reset()
+
+    # Runs the plan once ahead of time, so the first real update doesn't pay for touching fresh memory
+    def warmUp(self):
+        self._fft_in[:] = 0
+        self._fft()
+
+    # Forget every cached segment, e.g. when the signal we're estimating has changed
+    def reset(self):
+        self._count = 0
+        self._next_segment = None
+        self._sum[:] = 0
+
+    # Computes the one-sided density periodogram of every row of segment into out
+    def _periodogram(self, segment, out):
+        numpy.subtract(segment, numpy.mean(segment, axis=-1, keepdims=True), out=self._fft_in)
+        numpy.multiply(self._fft_in, self.window, out=self._fft_in)
+        spectrum = self._fft()
+        numpy.multiply(spectrum.real, spectrum.real, out=out)
+        out += spectrum.imag * spectrum.imag
+        out *= self.scale
+        if self.nperseg % 2:
+            out[:, 1:] *= 2
+        else:
+            out[:, 1:-1] *= 2
+
+    # Adds every segment completed since the last update and returns the (rows x freqs) averaged PSD.
+    # combine maps a (channels x samples) view of the store to the (rows x samples) signal we estimate the PSD of.
+    def update(self, sample_store, combine):
+        last = (sample_store.head - self.nperseg) // self.step
+        first = last - self.n_segments + 1
+        if self._next_segment is not None:
+            first = max(first, self._next_segment)
+        if first <= last:
+            # Combine the channels for all the new segments at once
+            start = first * self.step
+            stop = last * self.step + self.nperseg
+            trace = combine(sample_store.view(start, stop))
+            segments = sliding_window_view(trace, self.nperseg, axis=-1)[:, ::self.step]
+            for i, k in enumerate(range(first, last + 1)):
+                slot = k % self.n_segments
+                if self._count == self.n_segments:
+                    self._sum -= self._periodograms[slot]
+                else:
+                    self._count += 1
+                self._periodogram(segments[:, i], self._periodograms[slot])
+                self._sum += self._periodograms[slot]
+                # Resynchronize our running sum every time we go around the ring, so rounding errors can't pile up
+                if slot == self.n_segments - 1 and self._count == self.n_segments:
+                    self._sum[:] = numpy.sum(self._periodograms, axis=0, dtype='float64')
+            self._next_segment = last + 1
+        if self._count == 0:
+            return self.freqs, self._sum.copy()
+        return self.freqs, self._sum / self._count
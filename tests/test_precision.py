@@ -0,0 +1,67 @@
+## The pipeline in single precision should give the same spectra and band ratios as in double precision
+
+import numpy
+import pytest
+from packet_encoder import encodePackets
+from sample_decoder import DECODERS
+from filters import FilterBank, Decimator
+from sample_store import SampleStore
+from welch import IncrementalWelch
+from band_power import BandPowerTable
+import global_vars
+
+FS = 2048
+SAMPLES = 64
+CHANNELS = 8
+SECONDS = 12
+GAIN = (262143 + 262144) / ((8388607 + 8388608) * 2**8)
+FILTERS = {
+    "order": 4,
+    "notch_enabled": True, "notch_freq": 50, "notch_quality": 30,
+    "highpass_enabled": True, "highpass_cutoff": 0.5,
+    "bandpass_enabled": False, "bandpass_low": 1, "bandpass_high": 40,
+}
+
+# Tones in a few bands over noise, on top of the large DC offsets real electrodes have
+def makeRecording():
+    rng = numpy.random.default_rng(0)
+    t = numpy.arange(FS*SECONDS) / FS
+    channels = numpy.arange(CHANNELS)[:, numpy.newaxis]
+    signal = (3000*numpy.sin(2*numpy.pi*10*t) + 1500*numpy.sin(2*numpy.pi*(4 + channels)*t)
+              + 800*numpy.sin(2*numpy.pi*50*t) + 500*rng.standard_normal((CHANNELS, len(t))) + 200000*(channels + 1))
+    return signal.astype('int32')
+
+# Pushes the recording through the pipeline the way DataWorker does, a few packets at a time, returning the PSD of
+# every channel and the band ratios the FFT worker would show
+def runPipeline(recording, dtype, decoder, decimating_factor):
+    fs = FS / decimating_factor
+    packet_bytes = CHANNELS * SAMPLES * 3
+    stream = encodePackets(recording)
+    decoder = DECODERS[decoder](CHANNELS, SAMPLES, GAIN, dtype=dtype)
+    filter_bank = FilterBank(FS, FILTERS, dtype=dtype)
+    decimator = Decimator(decimating_factor, 101, CHANNELS, dtype=dtype)
+    store = SampleStore(CHANNELS, FS*SECONDS, dtype)
+    welch_window = int(8*fs)
+    welch = IncrementalWelch(fs, welch_window//5, welch_window, rows=CHANNELS, dtype=dtype)
+    for start in range(0, len(stream), 4*packet_bytes):
+        samples = decoder.decode(stream[start:start + 4*packet_bytes])
+        store.write(decimator.process(filter_bank.process(samples)))
+        assert store.view(store.head - 1, store.head).dtype == numpy.dtype(dtype)
+    freqs, psd = welch.update(store, lambda data: data)
+    bands = BandPowerTable(global_vars.FREQ_BANDS, freqs)
+    return psd, bands.relativePowers(psd)
+
+@pytest.mark.parametrize("decoder", list(DECODERS.keys()))
+@pytest.mark.parametrize("decimating_factor", [1, 4])
+def test_float32_matches_float64(decoder, decimating_factor):
+    recording = makeRecording()
+    psd64, ratios64 = runPipeline(recording, 'float64', decoder, decimating_factor)
+    psd32, ratios32 = runPipeline(recording, 'float32', decoder, decimating_factor)
+    # Bins well above the noise floor keep their relative accuracy, and the rest stay small next to the peak
+    peak = psd64.max(axis=-1, keepdims=True)
+    significant = psd64 > 1e-3 * peak
+    relative = numpy.abs(psd32 - psd64)[significant] / psd64[significant]
+    assert relative.max() < 1e-3
+    assert numpy.max(numpy.abs(psd32 - psd64) / peak) < 1e-4
+    # Band ratios are what the thresholds act on, so they have to agree closely
+    assert numpy.max(numpy.abs(ratios32 - ratios64)) < 1e-5